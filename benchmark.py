@@ -0,0 +1,218 @@
+# Benchmark sin ventana de GIFManager: spawn, colisiones, movimiento, explosiones y dibujo con escenas
+# aleatorias (con semilla) de 10 a 10000 sprites. Las llamadas GL se sustituyen por funciones vacías, así
+# que "draw" mide solo el trabajo de CPU (vértices, orden, lotes). Resultados en JSON.
+# Uso: python benchmark.py [--sizes 10,100,1000] [--frames N] [--output resultados.json]
+#                          [--baseline fichero.json] [--save-baseline] [--tolerance 0.15]
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import itertools
+import tracemalloc
+import numpy as np
+import prueba_opengl_class as app
+
+SIZES = [10, 100, 1000, 3000, 10000]
+FRAMES = 120
+SEED = 1234
+DT = 1.0 / app.SIM_HZ
+BASELINE_PATH = './benchmark_baseline.json'
+MEMORY_FRAMES = 10
+MIN_DELTA_MS = 0.05  # Diferencias menores que esto son ruido aunque en porcentaje parezcan grandes
+# Pantalla de referencia para 50 sprites; crece con el número de sprites para mantener la densidad
+BASE_SCREEN = (1920, 1080)
+BASE_SPRITES = 50
+SPAWN_KEYS = [b'z', b'x', b's', b'd']  # Cabezas y piolets para que haya explosiones, y dos GIFs animados
+PHASES = ('collisions', 'sprites', 'explosions', 'draw')
+
+
+def stub_gl():
+    # Sustituye las funciones gl* del módulo por funciones vacías; glGen* devuelve identificadores nuevos
+    ids = itertools.count(1)
+
+    def stub(name):
+        if name in ('glGenTextures', 'glGenBuffers'):
+            return lambda n=1, *args: next(ids) if n == 1 else [next(ids) for _ in range(n)]
+        return lambda *args, **kwargs: None
+
+    for name in list(vars(app)):
+        if name.startswith('gl') and not name.startswith('glut') and callable(getattr(app, name)):
+            setattr(app, name, stub(name))
+
+
+def screen_size(n):
+    scale = max(1.0, (n / BASE_SPRITES) ** 0.5)
+    return int(BASE_SCREEN[0] * scale), int(BASE_SCREEN[1] * scale)
+
+
+def build_scene(manager, n, seed):
+    # Pide n GIFs con teclas al azar y espera a que estén todos visibles. Devuelve los segundos que tarda
+    rng = random.Random(seed)
+    width, height = screen_size(n)
+    start = time.perf_counter()
+    for _ in range(n):
+        key = rng.choice(SPAWN_KEYS)
+        info = app.Gif_mapping[key]
+        manager.add_gif(key, info['path'], width, height, rotate_on_ready=rng.random() < 0.3,
+                        stick_on_collision=info['stick_on_collision'], max_width=info['max_width'],
+                        max_height=info['max_height'], colision_tipo=info.get('colision_tipo'))
+    while app.GIFManager.pending_gifs or any(manager.loading.values()):
+        manager.process_pending()
+        if app.GIFManager.pending_gifs:
+            time.sleep(0.001)
+    return time.perf_counter() - start
+
+
+def run_frames(manager, batch, frames):
+    timings = {phase: [] for phase in PHASES}
+    clock = time.perf_counter
+    for _ in range(frames):
+        t0 = clock()
+        manager.handle_collisions(manager.all_gifs())
+        t1 = clock()
+        manager.sprites.step(manager._all_slots, DT)
+        t2 = clock()
+        manager.update_explosions(DT)
+        t3 = clock()
+        manager.draw(batch)
+        t4 = clock()
+        timings['collisions'].append(t1 - t0)
+        timings['sprites'].append(t2 - t1)
+        timings['explosions'].append(t3 - t2)
+        timings['draw'].append(t4 - t3)
+    return timings
+
+
+def summarize(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'max_ms': round(float(ms.max()), 4),
+    }
+
+
+def bench_size(n, frames, asset_pack, seed=SEED):
+    app.GIFManager.pending_gifs.clear()
+    manager = app.GIFManager(asset_pack=asset_pack, seed=seed)
+    batch = app.SpriteBatch()
+    spawn = build_scene(manager, n, seed)
+    # Pasadas del recolector durante los frames: deberían ser 0 (los sprites y efectos salen de pools)
+    collections = []
+
+    def callback(phase, info):
+        if phase == 'start':
+            collections.append(info['generation'])
+    gc.collect()
+    gc.callbacks.append(callback)
+    timings = run_frames(manager, batch, frames)
+    gc.callbacks.remove(callback)
+    result = {
+        'sprites': n,
+        'screen': screen_size(n),
+        'spawn_ms': round(spawn * 1000, 3),
+        'spawn_us_per_sprite': round(spawn * 1e6 / n, 3),
+        'explosions_end': len(manager.explosions),
+        'gc_collections': len(collections),
+        'phases': {phase: summarize(samples) for phase, samples in timings.items()},
+        'frame': summarize([sum(parts) for parts in zip(*timings.values())]),
+    }
+    manager.release_all()
+    batch.release()
+
+    # Segunda pasada más corta con tracemalloc (ralentiza mucho, por eso no se mezcla con los tiempos)
+    app.GIFManager.pending_gifs.clear()
+    tracemalloc.start()
+    manager = app.GIFManager(asset_pack=asset_pack, seed=seed)
+    batch = app.SpriteBatch()
+    build_scene(manager, n, seed)
+    run_frames(manager, batch, MEMORY_FRAMES)
+    result['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 3)
+    tracemalloc.stop()
+    manager.release_all()
+    batch.release()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    # Compara la mediana de cada fase con la línea base; devuelve las que empeoran más de tolerance
+    regressions = []
+    base_by_size = {str(r['sprites']): r for r in baseline.get('results', [])}
+    print(f"{'sprites':>8} {'fase':>11} {'base ms':>10} {'ahora ms':>10} {'cambio':>8}")
+    for result in results:
+        base = base_by_size.get(str(result['sprites']))
+        if base is None:
+            continue
+        rows = [(phase, base['phases'][phase]['p50_ms'], result['phases'][phase]['p50_ms']) for phase in PHASES]
+        rows.append(('frame', base['frame']['p50_ms'], result['frame']['p50_ms']))
+        rows.append(('spawn', base['spawn_ms'], result['spawn_ms']))
+        for phase, before, now in rows:
+            change = (now - before) / before if before > 0 else 0.0
+            regressed = change > tolerance and now - before > MIN_DELTA_MS
+            mark = ' <-- regresión' if regressed else ''
+            print(f"{result['sprites']:>8} {phase:>11} {before:>10.3f} {now:>10.3f} {change:>+8.1%}{mark}")
+            if regressed:
+                regressions.append((result['sprites'], phase, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark sin ventana de GIFManager')
+    parser.add_argument('--sizes', default=','.join(str(n) for n in SIZES))
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output', help='fichero JSON de resultados (por defecto a la salida estándar)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='guardar los resultados como línea base')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='empeoramiento máximo admitido (0.15 = 15%%)')
+    args = parser.parse_args(argv)
+
+    stub_gl()
+    asset_pack = app.load_asset_pack(rebuild=False)
+    if asset_pack is None:
+        print("Sin pack de assets actualizado: el spawn incluye decodificar (python pack_assets.py)", file=sys.stderr)
+    results = []
+    for n in [int(size) for size in args.sizes.split(',')]:
+        result = bench_size(n, args.frames, asset_pack, args.seed)
+        results.append(result)
+        print(f"{n:>6} sprites: frame {result['frame']['mean_ms']:.3f} ms, spawn {result['spawn_ms']:.1f} ms, "
+              f"pico {result['peak_memory_mb']:.1f} MB, gc {result['gc_collections']}", file=sys.stderr)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'frames': args.frames,
+            'seed': args.seed,
+            'dt': DT,
+            'asset_pack': asset_pack is not None,
+        },
+        'results': results,
+    }
+    data = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data)
+    else:
+        print(data)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(data)
+        print(f"Línea base guardada en {args.baseline}", file=sys.stderr)
+        return 0
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    sys.stdout.flush()
+    regressions = compare(results, baseline, args.tolerance)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
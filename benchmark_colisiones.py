@@ -0,0 +1,77 @@
+# Benchmark de la fase de colisiones de GIFManager (no abre ventana ni usa GL)
+# Uso: python benchmark_colisiones.py [--naive]
+import sys
+import time
+import random
+from prueba_opengl_class import GIFManager, BouncingGIF, TextureCacheEntry
+
+SIZES = [100, 250, 500, 1000, 2000, 5000]
+SPRITE_SIZE = 120
+REPEATS = 5
+# Densidad fija: la pantalla crece con el número de sprites para que cada uno tenga ~4 sprites de área libre
+AREA_PER_SPRITE = (SPRITE_SIZE * 2) ** 2
+
+
+def fake_entry(path, width, height):
+    # Entrada de caché ya "subida" con un único frame, sin decodificar nada
+    entry = TextureCacheEntry((path, width, height))
+    entry.frames = [0]
+    entry.sizes = [(width, height)]
+    entry.uvs = [(0.0, 0.0, 1.0, 1.0)]
+    entry.set_durations([0.1])
+    entry.decoded = True
+    entry.uploaded = True
+    entry._done.set()
+    return entry
+
+
+def build_scene(manager, n, seed):
+    rng = random.Random(seed)
+    side = int((n * AREA_PER_SPRITE) ** 0.5)
+    # Sin cabezas para no crear explosiones (necesitan contexto GL): solo el coste de la fase de colisión
+    entry = fake_entry('piolet', SPRITE_SIZE, SPRITE_SIZE)
+    gifs = []
+    for _ in range(n):
+        gif = BouncingGIF(entry, manager.sprites, side, side, stick_on_collision=True, colision_tipo='piolet')
+        manager.sprites.set_frames(gif._slot, entry)
+        gif.x = rng.randint(0, side - SPRITE_SIZE)
+        gif.y = rng.randint(0, side - SPRITE_SIZE)
+        gif.ready = True
+        gifs.append(gif)
+    return gifs
+
+
+def naive_collisions(all_gifs):
+    # Doble bucle O(n²) anterior, solo para comparar
+    for i, gif1 in enumerate(all_gifs):
+        if not gif1.stick_on_collision or gif1.stuck_to is not None:
+            continue
+        for gif2 in all_gifs[i+1:]:
+            if not gif2.stick_on_collision or gif2.stuck_to is not None:
+                continue
+            if (gif1.x < gif2.x + gif2.width and gif1.x + gif1.width > gif2.x and
+                gif1.y < gif2.y + gif2.height and gif1.y + gif1.height > gif2.y):
+                gif2.stuck_to = gif1
+
+
+def run(naive=False):
+    print(f"{'sprites':>8} {'ms/frame':>10} {'us/sprite':>10} {'pegados':>8}")
+    for n in SIZES:
+        manager = GIFManager()
+        gifs = build_scene(manager, n, seed=n)
+        best = float('inf')
+        for _ in range(REPEATS):
+            for gif in gifs:
+                gif.stuck_to = None
+            start = time.perf_counter()
+            if naive:
+                naive_collisions(gifs)
+            else:
+                manager.handle_collisions(gifs)
+            best = min(best, time.perf_counter() - start)
+        stuck = sum(1 for gif in gifs if gif.stuck_to is not None)
+        print(f"{n:>8} {best * 1000:>10.2f} {best * 1e6 / n:>10.2f} {stuck:>8}")
+
+
+if __name__ == '__main__':
+    run(naive='--naive' in sys.argv)
@@ -0,0 +1,88 @@
+# Cliente de prueba del servidor de control UDP/OSC de prueba_opengl_class.py (sustituye al portátil de
+# control o a los puentes de luces/MIDI). No necesita OpenGL: solo la librería estándar
+# Uso: python control_client.py [--host 127.0.0.1] [--port 9000] [--osc] spawn z [1]
+#      python control_client.py remove z | background next | background previous
+#      python control_client.py [--osc] --ping 100   (latencia ida y vuelta hasta que el frame se muestra)
+import time
+import socket
+import struct
+import argparse
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9000
+PING_TIMEOUT = 1.0
+
+
+def encode_osc(address, *args):
+    def padded(text):
+        raw = text.encode('utf-8') + b'\0'
+        return raw + b'\0' * (-len(raw) % 4)
+    tags = ','
+    payload = b''
+    for arg in args:
+        if isinstance(arg, float):
+            tags += 'f'
+            payload += struct.pack('>f', arg)
+        elif isinstance(arg, int):
+            tags += 'i'
+            payload += struct.pack('>i', arg)
+        else:
+            tags += 's'
+            payload += padded(str(arg))
+    return padded(address) + padded(tags) + payload
+
+
+def encode_command(words, osc):
+    if not osc:
+        return ' '.join(words).encode('utf-8')
+    args = [int(word) if word.isdigit() else word for word in words[1:]]
+    return encode_osc('/' + words[0], *args)
+
+
+def ping(sock, target, count, osc):
+    # Cada ping se contesta tras el swap del frame que lo recoge: ida y vuelta y latencia medida en el servidor
+    round_trips = []
+    server_side = []
+    sock.settimeout(PING_TIMEOUT)
+    for _ in range(count):
+        start = time.perf_counter()
+        sock.sendto(encode_command(['ping'], osc), target)
+        try:
+            reply, _ = sock.recvfrom(1024)
+        except socket.timeout:
+            print("Sin respuesta")
+            continue
+        round_trips.append((time.perf_counter() - start) * 1000)
+        if osc:
+            server_side.append(struct.unpack('>f', reply[-4:])[0])
+        else:
+            server_side.append(float(reply.split()[1]))
+        time.sleep(0.01)
+    if not round_trips:
+        return
+    round_trips.sort()
+    server_side.sort()
+    print(f"{len(round_trips)}/{count} respuestas | ida y vuelta p50 {round_trips[len(round_trips) // 2]:.2f} ms, "
+          f"máx {round_trips[-1]:.2f} ms | en el servidor (llegada -> swap) p50 {server_side[len(server_side) // 2]:.2f} ms, "
+          f"máx {server_side[-1]:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Envía órdenes al servidor de control del background")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--osc', action='store_true', help="Enviar en OSC en vez de texto")
+    parser.add_argument('--ping', type=int, metavar='N', help="Medir la latencia con N pings")
+    parser.add_argument('command', nargs='*', help="spawn TECLA [1] | remove TECLA | background next|previous")
+    args = parser.parse_args()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = (args.host, args.port)
+    if args.command:
+        sock.sendto(encode_command(args.command, args.osc), target)
+    if args.ping:
+        ping(sock, target, args.ping, args.osc)
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+# Genera el pack de assets (img/assets.pack): las imágenes de Gif_mapping con sus tamaños (y los reducidos de los
+# niveles de calidad), la explosión y los fondos de Backgrounds, ya decodificados y redimensionados en RGBA crudo
+# para mapearlos al arrancar
+# Uso: python pack_assets.py [fichero_pack]
+import sys
+import time
+from prueba_opengl_class import AssetPack, ASSET_PACK
+
+
+def pack_all(out_path=ASSET_PACK):
+    start = time.perf_counter()
+    AssetPack.build(out_path)
+    pack = AssetPack(out_path)
+    print(f"{out_path}: {len(pack.index['assets'])} assets y {len(pack.index['backgrounds'])} fondos "
+          f"en {time.perf_counter() - start:.1f} s")
+    pack.close()
+
+
+if __name__ == '__main__':
+    pack_all(*sys.argv[1:2])
@@ -1,16 +1,103 @@
-# Requiere: PyOpenGL, Pillow
+# Requiere: PyOpenGL, Pillow, NumPy
 import sys
+import gc
+import asyncio
 import os
+import ctypes
+import json
+import math
+import bisect
+import hashlib
+import mmap
+import struct
+import heapq
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import random
 import time
 import threading
+import queue
+import weakref
+import subprocess
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
 from PIL import Image
 from OpenGL.GL import *
+from OpenGL.GL import shaders
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, deque
 
 FPS = 30
+SPRITE_SPEED = 150  # Velocidad de los sprites en píxeles por segundo (5 px por frame a 30 FPS)
+ROTATION_SPEED = 150  # Grados por segundo de los sprites que rotan
+DEFAULT_FRAME_DURATION = 0.1  # Segundos por frame si el GIF no trae duración (o trae una absurda, como los navegadores)
+MIN_FRAME_DURATION = 0.02
+SIM_HZ = 60  # Pasos de simulación por segundo (paso fijo, independiente de los FPS de pantalla)
+MAX_CATCHUP_STEPS = 5  # Máximo de pasos por frame al recuperar retraso; el resto se descarta
+SPIN_THRESHOLD = 0.002  # Los últimos segundos antes del plazo se esperan en bucle activo (sleep no es tan preciso)
+VSYNC = False  # True: el ritmo lo marca el refresco del monitor (glutSwapBuffers bloquea) en vez de dormir
+FRAME_STATS_INTERVAL = 10  # Segundos entre cada informe de FPS y tiempos de frame
+TEXTURE_STATS_INTERVAL = 60  # Segundos entre cada informe de texturas vivas
+PROFILER_HISTORY = 600  # Frames que guarda el profiler (anillo)
+PROFILER_HUD_FRAMES = 60  # Frames que se promedian en el HUD
+PROFILER_TRACE_PATH = './frame_trace.json'  # Exportación en formato Chrome trace (chrome://tracing, Perfetto)
+# Niveles de calidad del QualityGovernor, de mejor a peor. spawn_scale reduce max_width/max_height de los
+# GIFs nuevos, anim_divisor recalcula el frame de animación solo cada N pasos, max_per_key elimina los GIFs
+# más antiguos de cada tecla por encima de ese número
+QUALITY_LEVELS = (
+    {'name': 'completa', 'spawn_scale': 1.0, 'rotation': True, 'anim_divisor': 1, 'max_per_key': None, 'explosions': True},
+    {'name': 'sin explosiones', 'spawn_scale': 1.0, 'rotation': True, 'anim_divisor': 1, 'max_per_key': None, 'explosions': False},
+    {'name': 'media', 'spawn_scale': 0.75, 'rotation': True, 'anim_divisor': 2, 'max_per_key': None, 'explosions': False},
+    {'name': 'baja', 'spawn_scale': 0.5, 'rotation': False, 'anim_divisor': 3, 'max_per_key': 60, 'explosions': False},
+    {'name': 'mínima', 'spawn_scale': 0.5, 'rotation': False, 'anim_divisor': 4, 'max_per_key': 20, 'explosions': False},
+)
+QUALITY_DEGRADE_LOAD = 0.9  # Fracción del presupuesto de frame ocupada por trabajo a partir de la que se baja
+QUALITY_RESTORE_LOAD = 0.6  # Y por debajo de la que se vuelve a subir
+QUALITY_DEGRADE_FRAMES = 15  # Frames seguidos por encima antes de bajar un nivel
+QUALITY_RESTORE_FRAMES = 120  # Frames seguidos por debajo antes de subir (más lento: histéresis)
+QUALITY_SMOOTHING = 0.1  # Peso de cada frame en la media exponencial de la carga
+BACKGROUND_PREFETCH = 1  # Fondos vecinos (a cada lado del actual) que se cargan por adelantado
+BACKGROUND_VRAM_BUDGET = 96 * 1024 * 1024  # Bytes de textura como mucho para fondos residentes
+BACKGROUND_STREAM_QUEUE = 4  # Frames decodificados por adelantado de un fondo animado
+BACKGROUND_STREAM_TEXTURES = 3  # Texturas en anillo de un fondo animado: la visible, la siguiente y la que se sube
+BACKGROUND_SEQUENCE_FPS = 25  # Cadencia de los fondos que son un directorio de imágenes
+CONTROL_ENABLED = True  # Servidor UDP/OSC para lanzar GIFs y cambiar de fondo desde otra máquina
+CONTROL_HOST = '127.0.0.1'  # Solo local; '0.0.0.0' para aceptar órdenes del portátil de control en la red local
+CONTROL_PORT = 9000
+CONTROL_STATS_WINDOW = 600  # Latencias guardadas para el informe del servidor de control
+SESSION_STEPS_PER_FRAME = max(1, round(SIM_HZ / FPS))  # Pasos fijos por frame al reproducir una sesión
+CAPTURE_FORMAT = 'png'  # Grabación (F5): 'png' o 'raw' (secuencia de imágenes en CAPTURE_DIR) o 'pipe' (codificador)
+CAPTURE_DIR = './capture/{stamp}'  # {stamp}: fecha y hora de inicio, para no pisar grabaciones anteriores
+CAPTURE_VIDEO = './capture-{stamp}.mp4'  # Salida del codificador en modo 'pipe'
+# Codificador local que recibe los frames RGBA crudos por stdin
+CAPTURE_PIPE_COMMAND = ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', '{width}x{height}',
+                        '-r', '{fps}', '-i', '-', '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '{output}']
+CAPTURE_SCALE = 1  # Divisor del tamaño grabado (2 = mitad de ancho y alto); se reduce en la GPU antes de leer
+CAPTURE_PBO_COUNT = 3  # Anillo de PBOs: se mapea el frame N mientras se leen N+1 y N+2
+CAPTURE_SLOTS = 4  # Frames en memoria compartida esperando al proceso escritor; si no hay hueco se descarta
+CAPTURE_WRITER_TIMEOUT = 5.0  # Segundos que se espera al proceso escritor al parar antes de darlo por colgado
+COLLISION_CELL_SIZE = 256  # Lado en píxeles de las celdas del hash espacial de colisiones
+EXPLOSION_IMAGE = './img/blood.png'  # Textura de las explosiones, se carga una vez al arrancar
+EXPLOSION_DURATION = 1.0  # Segundos que dura una explosión
+SPAWN_MIN_DISTANCE = 150  # Distancia mínima en píxeles entre centros al aparecer un GIF
+SPAWN_ATTEMPTS = 50  # Candidatos que se prueban antes de dejarlo en un sitio aleatorio
+SPAWN_UNIFORM_ATTEMPTS = 8  # Los primeros candidatos son uniformes; el resto alrededor de sprites existentes
+ASSET_PACK = './img/assets.pack'  # Frames en RGBA crudo ya redimensionados, generado con pack_assets.py
+IMAGE_EXTENSIONS = ('.gif', '.png', '.jpg', '.jpeg', '.webp')
+ATLAS_MAX_SIZE = 4096  # Lado máximo de una página de atlas (lo soporta cualquier GPU actual)
+ATLAS_PADDING = 1  # Píxeles transparentes entre frames para que el filtrado lineal no mezcle vecinos
+ATLAS_TRIM = True  # Guardar cada frame sin sus bordes totalmente transparentes (con su desplazamiento)
+DECODE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))  # Procesos que decodifican assets en paralelo
+PRIORITY_SPAWN = 0  # Prioridades de la cola de decodificación: menor = antes
+PRIORITY_PREFETCH = 10
+UPLOAD_BUDGET_BYTES = 8 * 1024 * 1024  # Bytes de textura que se suben como mucho por frame
+UPLOAD_BUDGET_TIME = 0.004  # Segundos de subida como mucho por frame
+UPLOAD_PBO_COUNT = 2  # Pixel buffer objects que se alternan para subir por DMA sin esperar a la GPU
+GPU_MOTION = False  # Los sprites que nunca se pegan se mueven en la GPU (shader); se dibujan debajo de los demás
+GPU_FRAME_TABLE_WIDTH = 1024  # Ancho en texels de la tabla de frames que lee el shader
 Backgrounds = ['./img/background1.jpg', './img/background2.jpg']
 Gif_mapping = {
     b'a': {'path': './img/espana-spain.gif', 'stick_on_collision': False, 'max_width': 300, 'max_height': 300},
@@ -20,326 +107,3199 @@ Gif_mapping = {
     b'x': {'path': './img/piolet.png', 'stick_on_collision': True, 'max_width': 300, 'max_height': 300, 'colision_tipo': 'piolet'}
 }
 
+class TextureStats:
+    # Contador global de texturas vivas y de los bytes que ocupan (sin mipmaps)
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self._sizes = {}
+
+    def allocated(self, tex_id, nbytes):
+        self._sizes[tex_id] = nbytes
+        self.count += 1
+        self.bytes += nbytes
+
+    def freed(self, tex_id):
+        nbytes = self._sizes.pop(tex_id, None)
+        if nbytes is not None:
+            self.count -= 1
+            self.bytes -= nbytes
+
+    def report(self):
+        return f"Texturas vivas: {self.count} ({self.bytes / (1024 * 1024):.1f} MB)"
+
+texture_stats = TextureStats()
+
+def create_texture(img_data, width, height, internal_format=GL_RGBA, data_type=GL_UNSIGNED_BYTE,
+                   texel_bytes=4, tex_filter=GL_LINEAR):
+    tex_id = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, tex_id)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, tex_filter)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, tex_filter)
+    glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, GL_RGBA, data_type, img_data)
+    texture_stats.allocated(tex_id, width * height * texel_bytes)
+    return tex_id
+
+def upload_texture_rows(tex_id, y, width, rows, pixels, pbo=None):
+    # Copia `rows` filas RGBA a partir de la fila y. Con pbo los datos pasan por un pixel buffer object:
+    # glBufferData huérfana el buffer anterior y glTexSubImage2D lee del PBO de forma asíncrona
+    glBindTexture(GL_TEXTURE_2D, tex_id)
+    if pbo is None:
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, y, width, rows, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+        return
+    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pbo)
+    glBufferData(GL_PIXEL_UNPACK_BUFFER, pixels.nbytes, pixels, GL_STREAM_DRAW)
+    glTexSubImage2D(GL_TEXTURE_2D, 0, 0, y, width, rows, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+def delete_textures(tex_ids):
+    if not tex_ids:
+        return
+    glDeleteTextures(tex_ids)
+    for tex_id in tex_ids:
+        texture_stats.freed(tex_id)
+
+class SpriteBatch:
+    # Render por lotes: los vértices de todos los quads (con su rotación) se calculan en CPU con NumPy,
+    # se suben de una vez a un VBO en streaming y se lanza un glDrawArrays por cada tramo de quads
+    # consecutivos con la misma textura. El orden de dibujo es el de los arrays
+    VERTEX_STRIDE = 16  # x, y, u, v en float32
+    FULL_UV = np.array([0.0, 0.0, 1.0, 1.0], dtype=np.float32)
+
+    def __init__(self):
+        self.vbo = None
+        self.draw_calls = 0
+
+    @staticmethod
+    def quad_vertices(x, y, w, h, angle=None, uv=None, crop=None):
+        # crop: (dx, dy, w, h) por quad, la parte del frame que se dibuja (la guardada en el atlas sin bordes
+        # transparentes). La rotación sigue siendo alrededor del centro del frame completo
+        n = len(x)
+        hw = np.asarray(w, dtype=np.float64) / 2
+        hh = np.asarray(h, dtype=np.float64) / 2
+        cx = np.asarray(x, dtype=np.float64) + hw
+        cy = np.asarray(y, dtype=np.float64) + hh
+        # Esquinas en el mismo orden que el antiguo glBegin(GL_QUADS): (x,y) (x+w,y) (x+w,y+h) (x,y+h)
+        if crop is None:
+            ox = np.stack([-hw, hw, hw, -hw], axis=1)
+            oy = np.stack([-hh, -hh, hh, hh], axis=1)
+        else:
+            left = crop[:, 0] - hw
+            top = crop[:, 1] - hh
+            right = left + crop[:, 2]
+            bottom = top + crop[:, 3]
+            ox = np.stack([left, right, right, left], axis=1)
+            oy = np.stack([top, top, bottom, bottom], axis=1)
+        if angle is not None:
+            # Igual que glRotatef(angle, 0, 0, 1) alrededor del centro
+            rad = np.radians(angle)[:, None]
+            c, s = np.cos(rad), np.sin(rad)
+            ox, oy = ox * c - oy * s, ox * s + oy * c
+        if uv is None:
+            uv = np.broadcast_to(SpriteBatch.FULL_UV, (n, 4))
+        verts = np.empty((n, 4, 4), dtype=np.float32)
+        verts[:, :, 0] = cx[:, None] + ox
+        verts[:, :, 1] = cy[:, None] + oy
+        verts[:, :, 2] = uv[:, [0, 2, 2, 0]]
+        verts[:, :, 3] = uv[:, [1, 1, 3, 3]]
+        return verts
+
+    def draw(self, tex_ids, x, y, w, h, angle=None, uv=None, crop=None):
+        n = len(tex_ids)
+        if n == 0:
+            return
+        verts = self.quad_vertices(x, y, w, h, angle, uv, crop)
+        if self.vbo is None:
+            self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        # glBufferData con datos nuevos cada vez: el driver huérfana el buffer anterior y no hay que esperar a la GPU
+        glBufferData(GL_ARRAY_BUFFER, verts.nbytes, verts, GL_STREAM_DRAW)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(2, GL_FLOAT, self.VERTEX_STRIDE, ctypes.c_void_p(0))
+        glTexCoordPointer(2, GL_FLOAT, self.VERTEX_STRIDE, ctypes.c_void_p(8))
+        glEnable(GL_TEXTURE_2D)
+        glColor4f(1, 1, 1, 1)
+        tex_ids = np.asarray(tex_ids)
+        starts = np.concatenate([[0], np.flatnonzero(tex_ids[1:] != tex_ids[:-1]) + 1, [n]])
+        for start, end in zip(starts[:-1].tolist(), starts[1:].tolist()):
+            glBindTexture(GL_TEXTURE_2D, int(tex_ids[start]))
+            glDrawArrays(GL_QUADS, start * 4, (end - start) * 4)
+            self.draw_calls += 1
+        glDisable(GL_TEXTURE_2D)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def release(self):
+        if self.vbo is not None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+
+GPU_VERTEX_SHADER = """
+#version 130
+uniform float time;        // Reloj de movimiento del GIFManager
+uniform float anim_time;   // Reloj en el último paso con animación
+uniform float spin_time;   // Reloj que solo avanza con la rotación activada
+uniform float rotation;    // 0: se dibuja sin girar (nivel de calidad sin rotación)
+uniform sampler2D frame_table;
+uniform int table_width;
+in vec4 motion;  // x, y al aparecer; dx, dy
+in vec4 bounds;  // recorrido en x e y (pantalla menos tamaño), ángulo inicial, grados por segundo
+in vec4 clock;   // reloj de movimiento y de giro al aparecer, sin uso, esquina del quad (0-3)
+in vec4 anim;    // primer frame en la tabla, número de frames (0: hueco libre), inicio en la línea de tiempo, duración
+out vec2 uv;
+
+vec4 frame_texel(int frame, int field) {
+    int i = frame * 3 + field;
+    return texelFetch(frame_table, ivec2(i % table_width, i / table_width), 0);
+}
+
+float bounce(float p, float range) {
+    // Onda triangular: rebote sin pérdidas entre 0 y range
+    if (range <= 0.0)
+        return 0.0;
+    return range - abs(mod(p, 2.0 * range) - range);
+}
+
+void main() {
+    if (anim.y < 1.0) {
+        gl_Position = vec4(0.0, 0.0, 2.0, 1.0);
+        uv = vec2(0.0);
+        return;
+    }
+    float elapsed = time - clock.x;
+    vec2 pos = vec2(bounce(motion.x + motion.z * elapsed, bounds.x), bounce(motion.y + motion.w * elapsed, bounds.y));
+    // Frame: el primero que acaba después de t (searchsorted por bisección, como SpriteArrays.step)
+    int base = int(anim.x);
+    float t = anim.z + mod(anim_time - clock.x, anim.w);
+    int lo = 0;
+    int hi = int(anim.y) - 1;
+    while (lo < hi) {
+        int mid = (lo + hi) / 2;
+        if (frame_texel(base + mid, 2).x <= t)
+            lo = mid + 1;
+        else
+            hi = mid;
+    }
+    vec4 frame_uv = frame_texel(base + lo, 0);
+    vec4 crop = frame_texel(base + lo, 1);
+    vec2 size = frame_texel(base + lo, 2).yz;
+    // Esquinas en el orden de SpriteBatch.quad_vertices, girando alrededor del centro del frame completo
+    int corner = int(clock.w);
+    vec2 k = vec2(corner == 1 || corner == 2 ? 1.0 : 0.0, corner >= 2 ? 1.0 : 0.0);
+    vec2 offset = crop.xy + k * crop.zw - size / 2.0;
+    float angle = radians(bounds.z + bounds.w * (spin_time - clock.y)) * rotation;
+    float c = cos(angle);
+    float s = sin(angle);
+    offset = vec2(offset.x * c - offset.y * s, offset.x * s + offset.y * c);
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(pos + size / 2.0 + offset, 0.0, 1.0);
+    uv = mix(frame_uv.xy, frame_uv.zw, k);
+}
+"""
+
+GPU_FRAGMENT_SHADER = """
+#version 130
+uniform sampler2D sprite_texture;
+in vec2 uv;
+
+void main() {
+    gl_FragColor = texture(sprite_texture, uv);
+}
+"""
+
+class GPUSpritePool:
+    # Los quads de una textura: 4 vértices por sprite con todos sus parámetros, escritos una vez al aparecer.
+    # Los huecos de los eliminados se reutilizan; mientras tanto son quads vacíos que el shader descarta
+    def __init__(self, texture, capacity=64):
+        self.texture = texture
+        self.vbo = None
+        self.data = np.zeros((capacity, 4, GPUSpriteLayer.FLOATS), dtype=np.float32)
+        self.rows = np.full(capacity, -1, dtype=np.int64)  # Fila de SpriteArrays de cada hueco
+        self.used = 0
+        self.live = 0
+        self.free_slots = []
+        self.dirty = None  # Tramo [inicio, fin) pendiente de subir
+        self.vbo_capacity = 0
+
+    def alloc(self, row):
+        if self.free_slots:
+            index = self.free_slots.pop()
+        else:
+            if self.used == len(self.rows):
+                capacity = len(self.rows) * 2
+                self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+                self.rows = np.concatenate([self.rows, np.full(capacity - len(self.rows), -1, dtype=np.int64)])
+            index = self.used
+            self.used += 1
+        self.rows[index] = row
+        self.live += 1
+        return index
+
+    def free(self, index):
+        self.data[index] = 0
+        self.rows[index] = -1
+        self.live -= 1
+        self.free_slots.append(index)
+        self.mark(index)
+
+    def mark(self, index):
+        start, end = self.dirty or (index, index + 1)
+        self.dirty = (min(start, index), max(end, index + 1))
+
+    def upload(self):
+        if self.vbo is None:
+            self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        if self.vbo_capacity != len(self.rows):
+            glBufferData(GL_ARRAY_BUFFER, self.data.nbytes, self.data, GL_DYNAMIC_DRAW)
+            self.vbo_capacity = len(self.rows)
+        elif self.dirty is not None:
+            start, end = self.dirty
+            glBufferSubData(GL_ARRAY_BUFFER, start * self.data[0].nbytes, self.data[start:end])
+        self.dirty = None
+
+    def release(self):
+        if self.vbo is not None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+
+
+class GPUSpriteLayer:
+    # Movimiento en la GPU de los sprites que nunca se pegan (sin stick_on_collision): su trayectoria es
+    # analítica (velocidad constante reflejada en los bordes y giro lineal en el tiempo), así que al aparecer
+    # se sube una vez su origen, velocidad, recorrido, giro y el reloj de ese momento, y el vertex shader
+    # calcula posición, ángulo y frame con los relojes del GIFManager como uniforms. La CPU solo escribe en
+    # las altas y bajas, y la tabla de frames (uv, recorte, fin en la línea de tiempo y tamaño de cada frame
+    # de SpriteArrays) cuando llega un asset nuevo. Un glDrawArrays por textura, debajo del SpriteBatch
+    FLOATS = 16  # motion, bounds, clock y anim (4 vec4) por vértice
+    ATTRIBUTES = ('motion', 'bounds', 'clock', 'anim')
+    UNIFORMS = ('time', 'anim_time', 'spin_time', 'rotation', 'frame_table', 'table_width', 'sprite_texture')
+
+    def __init__(self, table_width=GPU_FRAME_TABLE_WIDTH):
+        self.table_width = table_width
+        self.program = None  # False si los shaders no compilan: los sprites siguen en la CPU
+        self.locations = {}
+        self.pools = {}  # textura -> GPUSpritePool
+        self.where = {}  # fila de SpriteArrays -> (pool, hueco)
+        self.table_texture = None
+        self.table_frames = 0
+        self.table_version = 0
+        self.draw_calls = 0
+
+    def available(self):
+        # Compila los shaders la primera vez (necesita contexto GL)
+        if self.program is None:
+            try:
+                vertex = shaders.compileShader(GPU_VERTEX_SHADER, GL_VERTEX_SHADER)
+                fragment = shaders.compileShader(GPU_FRAGMENT_SHADER, GL_FRAGMENT_SHADER)
+                program = glCreateProgram()
+                glAttachShader(program, vertex)
+                glAttachShader(program, fragment)
+                # motion en el atributo 0: algunos drivers no dibujan si el 0 no está activo
+                for location, name in enumerate(self.ATTRIBUTES):
+                    glBindAttribLocation(program, location, name)
+                glLinkProgram(program)
+                glDeleteShader(vertex)
+                glDeleteShader(fragment)
+                if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+                    raise RuntimeError(glGetProgramInfoLog(program))
+            except (RuntimeError, GLError) as e:
+                print(f"Movimiento en GPU no disponible, se usa la CPU: {e}")
+                self.program = False
+                return False
+            self.program = program
+            self.locations = {name: glGetUniformLocation(program, name) for name in self.UNIFORMS}
+        return self.program is not False
+
+    @staticmethod
+    def accepts(entry):
+        # Todos los frames en una página de atlas (una textura por draw call) y del mismo tamaño (recorrido fijo)
+        return len(set(entry.frames)) == 1 and len(set(entry.sizes)) == 1
+
+    def add(self, slot, sprites, clock, spin_clock):
+        # Copia la fila ya colocada en su pool; a partir de aquí SpriteArrays.step la salta
+        tex = int(sprites.frame_tex[sprites.frame_base[slot]])
+        pool = self.pools.get(tex)
+        if pool is None:
+            pool = self.pools[tex] = GPUSpritePool(tex)
+        index = pool.alloc(slot)
+        spin = ROTATION_SPEED if sprites.rotate_enabled[slot] else 0.0
+        vertices = pool.data[index]
+        vertices[:, 0:4] = (sprites.x[slot], sprites.y[slot], sprites.dx[slot], sprites.dy[slot])
+        vertices[:, 4:8] = (sprites.screen_width[slot] - sprites.width[slot], sprites.screen_height[slot] - sprites.height[slot],
+                            sprites.rotate_angle[slot], spin)
+        vertices[:, 8:11] = (clock, spin_clock, 0.0)
+        vertices[:, 11] = (0, 1, 2, 3)
+        vertices[:, 12:16] = (sprites.frame_base[slot], sprites.frame_count[slot], sprites.anim_start[slot], sprites.anim_total[slot])
+        pool.mark(index)
+        self.where[slot] = (pool, index)
+        sprites.gpu[slot] = True
+
+    def remove(self, slot, sprites):
+        pool, index = self.where.pop(slot, (None, None))
+        if pool is None:
+            return
+        sprites.gpu[slot] = False
+        pool.free(index)
+        if pool.live == 0:
+            # La textura puede liberarse y su id reutilizarse para otra: el pool vacío se descarta
+            pool.release()
+            del self.pools[pool.texture]
+
+    def sync(self, sprites, clock, spin_clock):
+        # Posición y ángulo actuales en SpriteArrays, con la misma fórmula que el shader (para el PlacementService)
+        for pool in self.pools.values():
+            live = np.flatnonzero(pool.rows[:pool.used] >= 0)
+            rows = pool.rows[live]
+            params = pool.data[live, 0].astype(np.float64)
+            elapsed = clock - params[:, 8]
+            for field, axis in (('x', 0), ('y', 1)):
+                span = params[:, 4 + axis]
+                position = params[:, axis] + params[:, 2 + axis] * elapsed
+                wave = span - np.abs(np.mod(position, np.where(span > 0, 2 * span, 1.0)) - span)
+                getattr(sprites, field)[rows] = np.where(span > 0, wave, 0.0)
+            sprites.rotate_angle[rows] = (params[:, 6] + params[:, 7] * (spin_clock - params[:, 9])) % 360
+
+    def _upload_table(self, sprites):
+        frames = len(sprites.frame_end)
+        table = np.zeros((frames, 3, 4), dtype=np.float32)
+        table[:, 0] = sprites.frame_uv
+        table[:, 1] = sprites.frame_crop
+        table[:, 2, 0] = sprites.frame_end
+        table[:, 2, 1] = sprites.frame_w
+        table[:, 2, 2] = sprites.frame_h
+        height = -(-frames * 3 // self.table_width)
+        texels = np.zeros((height * self.table_width, 4), dtype=np.float32)
+        texels[:frames * 3] = table.reshape(-1, 4)
+        # La tabla crece con cada asset nuevo: se cambia por una textura del tamaño nuevo
+        if self.table_texture is not None:
+            delete_textures([self.table_texture])
+        self.table_texture = create_texture(texels, self.table_width, height, GL_RGBA32F, GL_FLOAT, 16, GL_NEAREST)
+        self.table_frames = frames
+        if self.table_version != sprites.frames_version:
+            # SpriteArrays compactó la tabla: los sprites ya subidos apuntan a sus frames nuevos
+            for pool in self.pools.values():
+                live = np.flatnonzero(pool.rows[:pool.used] >= 0)
+                rows = pool.rows[live]
+                pool.data[live, :, 12] = sprites.frame_base[rows][:, None]
+                pool.data[live, :, 14] = sprites.anim_start[rows][:, None]
+                if len(live):
+                    pool.mark(int(live[0]))
+                    pool.mark(int(live[-1]))
+            self.table_version = sprites.frames_version
+
+    def draw(self, sprites, clock, anim_clock, spin_clock, rotation=True):
+        if not self.pools or not self.program:
+            return
+        if self.table_frames != len(sprites.frame_end) or self.table_version != sprites.frames_version:
+            self._upload_table(sprites)
+        glUseProgram(self.program)
+        loc = self.locations
+        glUniform1f(loc['time'], clock)
+        glUniform1f(loc['anim_time'], anim_clock)
+        glUniform1f(loc['spin_time'], spin_clock)
+        glUniform1f(loc['rotation'], 1.0 if rotation else 0.0)
+        glUniform1i(loc['table_width'], self.table_width)
+        glUniform1i(loc['frame_table'], 1)
+        glUniform1i(loc['sprite_texture'], 0)
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, self.table_texture)
+        glActiveTexture(GL_TEXTURE0)
+        for location in range(len(self.ATTRIBUTES)):
+            glEnableVertexAttribArray(location)
+        stride = self.FLOATS * 4
+        for tex, pool in self.pools.items():
+            pool.upload()
+            for location in range(len(self.ATTRIBUTES)):
+                glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(location * 16))
+            glBindTexture(GL_TEXTURE_2D, tex)
+            glDrawArrays(GL_QUADS, 0, pool.used * 4)
+            self.draw_calls += 1
+        for location in range(len(self.ATTRIBUTES)):
+            glDisableVertexAttribArray(location)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    def release(self):
+        for pool in self.pools.values():
+            pool.release()
+        self.pools.clear()
+        self.where.clear()
+        if self.table_texture is not None:
+            delete_textures([self.table_texture])
+            self.table_texture = None
+            self.table_frames = 0
+        if self.program:
+            glDeleteProgram(self.program)
+        self.program = None
+
+def decode_background(path, width, height, asset_pack=None):
+    # RGBA reducido a como mucho el tamaño de pantalla (se dibuja estirado a pantalla completa, así que
+    # más resolución no se ve). Del pack si está, si no de la imagen original
+    packed = asset_pack.background(path) if asset_pack else None
+    if packed is not None:
+        src_w, src_h, pixels = packed
+        img = Image.frombuffer('RGBA', (src_w, src_h), pixels, 'raw', 'RGBA', 0, 1)
+    else:
+        img = Image.open(path).convert('RGBA')
+    size = (min(img.size[0], width), min(img.size[1], height))
+    if size != img.size:
+        img = img.resize(size, Image.LANCZOS)
+    return size[0], size[1], img.tobytes()
+
+def is_animated_background(path):
+    # Directorio de imágenes o imagen con varios frames: se reproduce en streaming en vez de cargarse entera
+    if os.path.isdir(path):
+        return True
+    try:
+        with Image.open(path) as img:
+            return getattr(img, 'n_frames', 1) > 1
+    except Exception:
+        return False
+
+def iterate_background_frames(path, max_width, max_height):
+    # Generador infinito de (tamaño, bytes RGBA, duración) del clip en bucle, todos los frames al tamaño del
+    # primero reducido a pantalla. Solo hay un frame en memoria a la vez
+    size = None
+    while True:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+            frames = ((Image.open(os.path.join(path, name)), 1 / BACKGROUND_SEQUENCE_FPS) for name in names)
+        else:
+            clip = Image.open(path)
+            frames = ((clip, frame_duration(clip)) for _ in iterate_seek(clip))
+        produced = False
+        for img, duration in frames:
+            frame = img.convert('RGBA')
+            if size is None:
+                size = (min(frame.size[0], max_width), min(frame.size[1], max_height))
+            if frame.size != size:
+                frame = frame.resize(size, Image.LANCZOS)
+            produced = True
+            yield size, frame.tobytes(), duration
+        if not produced:
+            raise ValueError(f"{path} no tiene frames")
+
+def iterate_seek(img):
+    for index in range(getattr(img, 'n_frames', 1)):
+        img.seek(index)
+        yield index
+
+class StreamFrame:
+    # Textura del anillo de un fondo animado. Se reutiliza: el TextureUploader la rellena por filas igual
+    # que una TextureCacheEntry (decoded/uploaded/upload_step)
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.tex_id = create_texture(None, width, height)
+        self.duration = DEFAULT_FRAME_DURATION
+        self.decoded = False
+        self.uploaded = False
+        self._pixels = None
+        self._row = 0
+
+    def load(self, pixels, duration):
+        self._pixels = pixels
+        self._row = 0
+        self.duration = duration
+        self.decoded = True
+        self.uploaded = False
+
+    def upload_step(self, max_bytes=None, pbo=None):
+        if self.uploaded or not self.decoded:
+            return 0
+        row_bytes = self.width * 4
+        rows = self.height - self._row
+        if max_bytes is not None:
+            rows = max(1, min(rows, max_bytes // row_bytes))
+        pixels = np.frombuffer(self._pixels, dtype=np.uint8, count=rows * row_bytes, offset=self._row * row_bytes)
+        upload_texture_rows(self.tex_id, self._row, self.width, rows, pixels, pbo)
+        self._row += rows
+        if self._row >= self.height:
+            self.uploaded = True
+            self._pixels = None
+        return rows * row_bytes
+
+class StreamingBackground:
+    # Fondo animado de cualquier duración con memoria acotada: un hilo productor decodifica en bucle hacia
+    # una cola de BACKGROUND_STREAM_QUEUE frames (se bloquea cuando está llena) y en el hilo GL los frames
+    # pasan a un anillo de BACKGROUND_STREAM_TEXTURES texturas con el presupuesto del uploader. Cada frame
+    # se muestra su duración; al dar la vuelta el productor ya va por delante, así que no hay tirón
+    def __init__(self, path, max_width, max_height, uploader=None):
+        self.path = path
+        self.uploader = uploader
+        self.frames_queue = queue.Queue(maxsize=BACKGROUND_STREAM_QUEUE)
+        self.ring = []
+        self.sizes = []
+        self.pending = deque()  # Texturas cargadas en orden de reproducción, aún sin mostrar
+        self.showing = None
+        self.next_switch = None
+        self.failed = False
+        self._stop = threading.Event()
+        threading.Thread(target=self._produce, args=(max_width, max_height), daemon=True).start()
+
+    def _produce(self, max_width, max_height):
+        try:
+            for item in iterate_background_frames(self.path, max_width, max_height):
+                while not self._stop.is_set():
+                    try:
+                        self.frames_queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if self._stop.is_set():
+                    return
+        except Exception as e:
+            print(f"Error abriendo fondo {self.path}: {e}")
+            self.failed = True
+
+    def update(self, playing, now):
+        # En el hilo GL. Sin playing (vecino precargado) solo prepara el primer frame y llena el anillo
+        if self._stop.is_set():
+            return
+        while True:
+            free = [frame for frame in self.ring if frame is not self.showing and frame not in self.pending]
+            if self.ring and not free:
+                break
+            try:
+                (width, height), pixels, duration = self.frames_queue.get_nowait()
+            except queue.Empty:
+                break
+            if not self.ring:
+                self.ring = [StreamFrame(width, height) for _ in range(BACKGROUND_STREAM_TEXTURES)]
+                self.sizes = [(width, height)] * len(self.ring)
+                free = self.ring
+            frame = free[0]
+            frame.load(pixels, duration)
+            self.pending.append(frame)
+            if self.uploader is not None:
+                self.uploader.request(frame)
+            else:
+                frame.upload_step()
+        if not self.pending or not self.pending[0].uploaded:
+            return
+        if self.showing is None:
+            self.showing = self.pending.popleft()
+            self.next_switch = now + self.showing.duration
+        elif playing and now >= self.next_switch:
+            if now - self.next_switch > self.showing.duration:
+                self.next_switch = now  # Venía parado (precargado o sin frames a tiempo): se reengancha
+            self.showing = self.pending.popleft()
+            self.next_switch += self.showing.duration
+
+    @property
+    def texture(self):
+        return self.showing.tex_id if self.showing is not None else None
+
+    def free(self):
+        self._stop.set()
+        delete_textures([frame.tex_id for frame in self.ring])
+        for frame in self.ring:
+            frame.decoded = False  # Por si seguía en la cola del uploader
+        self.ring = []
+        self.sizes = []
+        self.pending.clear()
+        self.showing = None
+
 class BackgroundManager:
-    def __init__(self, backgrounds):
+    # Fondos cargados bajo demanda: un hilo decodifica el actual y sus vecinos (BACKGROUND_PREFETCH a cada
+    # lado) reducidos a pantalla, se suben con el presupuesto del TextureUploader y los residentes se
+    # guardan en una LRU limitada por BACKGROUND_VRAM_BUDGET. Mientras el fondo pedido no está listo se
+    # sigue dibujando el anterior. Los fondos animados son StreamingBackground: se reproducen solo mientras
+    # se ven y los vecinos se quedan con el primer frame preparado
+    def __init__(self, backgrounds, asset_pack=None, uploader=None):
         self.backgrounds = backgrounds
-        self.textures = []
+        self.asset_pack = asset_pack
+        self.uploader = uploader
         self.current_index = 0
+        self.screen_size = None
+        self.resident = OrderedDict()  # índice -> TextureCacheEntry subida, de menos a más reciente
+        self.loading = {}  # índice -> TextureCacheEntry decodificada o pendiente de subir
+        self._shown = None
+        self._wanted = []
+        self._cond = threading.Condition()
+        self._stop = None  # Event del hilo de decodificación en marcha
+
+    def set_screen_size(self, width, height):
+        if self.screen_size == (width, height):
+            return
+        # Con otro tamaño de pantalla los fondos ya reducidos no sirven: se vuelven a cargar
+        running = self._stop is not None
+        self.release()
+        self.screen_size = (width, height)
+        if running:
+            self.load_textures()
 
     def load_textures(self):
-        self.textures = []
-        for bg in self.backgrounds:
-            tex_id, w, h = self.load_texture(bg)
-            self.textures.append((tex_id, w, h))
-
-    def load_texture(self, image_path):
-        img = Image.open(image_path).convert('RGBA')
-        img_data = img.tobytes()
-        width, height = img.size
-        tex_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, tex_id)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
-        return tex_id, width, height
-
-    def draw(self, screen_width, screen_height):
-        if not self.textures:
-            return
-        idx = self.current_index % len(self.textures)
-        tex_id, w, h = self.textures[idx]
-        glEnable(GL_TEXTURE_2D)
-        glBindTexture(GL_TEXTURE_2D, tex_id)
-        glColor4f(1, 1, 1, 1)
-        glBegin(GL_QUADS)
-        glTexCoord2f(0, 0); glVertex2f(0, 0)
-        glTexCoord2f(1, 0); glVertex2f(screen_width, 0)
-        glTexCoord2f(1, 1); glVertex2f(screen_width, screen_height)
-        glTexCoord2f(0, 1); glVertex2f(0, screen_height)
-        glEnd()
-        glDisable(GL_TEXTURE_2D)
+        # Solo arranca el hilo y pide el fondo actual y sus vecinos: no depende de cuántos fondos haya
+        if not self.backgrounds or self._stop is not None:
+            return
+        self._stop = threading.Event()
+        threading.Thread(target=self._decode_loop, args=(self._stop,), daemon=True).start()
+        self._request()
+
+    def _request(self):
+        n = len(self.backgrounds)
+        wanted = [self.current_index % n]
+        for offset in range(1, BACKGROUND_PREFETCH + 1):
+            for index in ((self.current_index + offset) % n, (self.current_index - offset) % n):
+                if index not in wanted:
+                    wanted.append(index)
+        with self._cond:
+            self._wanted = wanted
+            self._cond.notify()
+
+    def _decode_loop(self, stop):
+        while True:
+            with self._cond:
+                while True:
+                    if stop.is_set():
+                        return
+                    todo = [i for i in self._wanted if i not in self.resident and i not in self.loading]
+                    if todo and self.screen_size is not None:
+                        break
+                    self._cond.wait()
+                index = todo[0]
+                path = self.backgrounds[index]
+                screen_size = self.screen_size
+                entry = TextureCacheEntry((path,) + screen_size)
+                self.loading[index] = entry
+            if is_animated_background(path):
+                stream = StreamingBackground(path, *screen_size, uploader=self.uploader)
+                with self._cond:
+                    if self.loading.get(index) is entry:
+                        self.loading[index] = stream
+                    else:
+                        stream.free()
+                continue
+            try:
+                width, height, pixels = decode_background(path, *entry.key[1:], asset_pack=self.asset_pack)
+            except Exception as e:
+                entry.fail_loading(e)
+            else:
+                entry.finish_loading(([(width, height, pixels)], [(0, 0, 0, width, height, 0, 0, width, height)], [DEFAULT_FRAME_DURATION]))
+
+    def update(self):
+        # En el hilo GL, una vez por frame: encola la subida de los decodificados y pasa a residentes los subidos
+        with self._cond:
+            loading = list(self.loading.items())
+        for index, entry in loading:
+            if entry.failed:
+                continue
+            if isinstance(entry, StreamingBackground):
+                with self._cond:
+                    if self.loading.get(index) is entry:
+                        del self.loading[index]
+                        self.resident[index] = entry
+                continue
+            if entry.decoded and not entry.uploaded:
+                if self.uploader is not None:
+                    self.uploader.request(entry)
+                else:
+                    entry.upload()
+            if entry.uploaded:
+                with self._cond:
+                    if self.loading.get(index) is entry:
+                        del self.loading[index]
+                        self.resident[index] = entry
+        now = time.perf_counter()
+        current = self.current_index % len(self.backgrounds) if self.backgrounds else None
+        for index, entry in list(self.resident.items()):
+            if isinstance(entry, StreamingBackground):
+                entry.update(index == current, now)
+        self.evict()
+
+    @staticmethod
+    def _entry_bytes(entry):
+        return sum(w * h * 4 for w, h in entry.sizes)
+
+    @staticmethod
+    def _texture(entry):
+        if entry is None:
+            return None
+        if isinstance(entry, StreamingBackground):
+            return entry.texture
+        return entry.frames[0]
+
+    def evict(self):
+        # LRU por bytes; nunca se expulsa el fondo que se está viendo ni el que se ha pedido
+        keep = {self.current_index % len(self.backgrounds), self._shown} if self.backgrounds else set()
+        total = sum(self._entry_bytes(entry) for entry in self.resident.values())
+        for index in list(self.resident):
+            if total <= BACKGROUND_VRAM_BUDGET:
+                break
+            if index in keep:
+                continue
+            with self._cond:
+                entry = self.resident.pop(index)
+            total -= self._entry_bytes(entry)
+            entry.free()
+
+    def release(self):
+        with self._cond:
+            if self._stop is not None:
+                self._stop.set()
+                self._stop = None
+            self._cond.notify_all()
+            entries = list(self.resident.values()) + list(self.loading.values())
+            self.resident.clear()
+            self.loading = {}
+        for entry in entries:
+            entry.free()
+        self._shown = None
+
+    def draw(self, screen_width, screen_height, batch):
+        if not self.backgrounds:
+            return
+        index = self.current_index % len(self.backgrounds)
+        if self._texture(self.resident.get(index)) is not None:
+            self._shown = index
+            self.resident.move_to_end(index)
+        tex_id = self._texture(self.resident.get(self._shown))
+        if tex_id is None:
+            return
+        batch.draw([tex_id], [0], [0], [screen_width], [screen_height])
 
     def next(self):
-        if self.textures:
-            self.current_index = (self.current_index + 1) % len(self.textures)
+        if self.backgrounds:
+            self.current_index = (self.current_index + 1) % len(self.backgrounds)
+            self._request()
             print(f"Fondo cambiado a: {self.current_index}")
 
     def previous(self):
-        if self.textures:
-            self.current_index = (self.current_index - 1) % len(self.textures)
+        if self.backgrounds:
+            self.current_index = (self.current_index - 1) % len(self.backgrounds)
+            self._request()
             print(f"Fondo cambiado a: {self.current_index}")
 
+def frame_duration(img):
+    # Duración del frame actual en segundos (Pillow la da en milisegundos en info['duration'])
+    duration = img.info.get('duration') or 0
+    if duration / 1000 < MIN_FRAME_DURATION:
+        return DEFAULT_FRAME_DURATION
+    return duration / 1000
+
+def decode_frames(path, max_width=None, max_height=None):
+    # Abre la imagen (animada o no) y devuelve sus frames distintos en RGBA, reducidos si superan el tamaño
+    # máximo, el índice en esa lista de cada frame de la animación y la duración de cada uno en segundos.
+    # Los frames repetidos se detectan por hash y se guardan una vez; si se repite el anterior, en vez de
+    # otro frame se alarga su duración
+    img = Image.open(path)
+    try:
+        n_frames = getattr(img, 'n_frames', 1)
+    except Exception:
+        n_frames = 1
+    def resize_if_needed(im):
+        w, h = im.size
+        scale = 1.0
+        if max_width is not None and w > max_width:
+            scale = min(scale, max_width / w)
+        if max_height is not None and h > max_height:
+            scale = min(scale, max_height / h)
+        if scale < 1.0:
+            new_w = max(1, int(w * scale))
+            new_h = max(1, int(h * scale))
+            return im.resize((new_w, new_h), Image.LANCZOS)
+        return im
+    pil_frames = []
+    frame_map = []
+    durations = []
+    seen = {}
+    def add(frame_img, duration):
+        frame_img = resize_if_needed(frame_img)
+        key = (frame_img.size, hashlib.blake2b(frame_img.tobytes(), digest_size=16).digest())
+        index = seen.get(key)
+        if index is None:
+            index = seen[key] = len(pil_frames)
+            pil_frames.append(frame_img)
+        if frame_map and frame_map[-1] == index:
+            durations[-1] += duration
+        else:
+            frame_map.append(index)
+            durations.append(duration)
+    if n_frames > 1:
+        for frame in range(n_frames):
+            img.seek(frame)
+            add(img.convert('RGBA'), frame_duration(img))
+    else:
+        add(img.convert('RGBA'), DEFAULT_FRAME_DURATION)
+    return pil_frames, frame_map, durations
+
+def trim_frame(frame_img):
+    # Recorta los bordes totalmente transparentes. Devuelve el recorte y (x, y) de su esquina en el frame
+    bbox = frame_img.getchannel('A').getbbox()
+    if bbox is None:
+        bbox = (0, 0, 1, 1)  # Frame vacío: basta un píxel transparente
+    if bbox == (0, 0) + frame_img.size:
+        return frame_img, (0, 0)
+    return frame_img.crop(bbox), bbox[:2]
+
+def pack_atlas(sizes, max_size=ATLAS_MAX_SIZE, padding=ATLAS_PADDING):
+    # Empaquetado por estantes conservando el orden de los frames.
+    # Devuelve (rects, page_sizes) con rects[i] = (página, x, y, w, h)
+    if not sizes:
+        return [], []
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    widest = max(w for w, _ in sizes) + padding
+    page_width = min(max_size, max(widest, int(math.ceil(math.sqrt(area)))))
+    rects = []
+    page_sizes = []
+    page, x, y, shelf_h, used_w = 0, 0, 0, 0, 0
+    for w, h in sizes:
+        if x + w > page_width:
+            x, y, shelf_h = 0, y + shelf_h, 0
+        if y + h > max_size:
+            page_sizes.append((used_w, y))
+            page, x, y, shelf_h, used_w = page + 1, 0, 0, 0, 0
+        rects.append((page, x, y, w, h))
+        x += w + padding
+        shelf_h = max(shelf_h, h + padding)
+        used_w = max(used_w, x)
+    page_sizes.append((used_w, y + shelf_h))
+    return rects, page_sizes
+
+def build_atlas_pages(pil_frames, rects, page_sizes):
+    pages = [Image.new('RGBA', size, (0, 0, 0, 0)) for size in page_sizes]
+    for frame_img, (page, x, y, _, _) in zip(pil_frames, rects):
+        pages[page].paste(frame_img, (x, y))
+    return pages
+
+def atlas_key(path, max_width=None, max_height=None):
+    return f"{os.path.abspath(path)}|{max_width}|{max_height}"
+
+def source_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+def decode_asset(path, max_width=None, max_height=None, trim=ATLAS_TRIM):
+    # Se ejecuta en los procesos del DecodePool: devuelve las páginas de atlas en RGBA crudo
+    # [(w, h, bytes)], el rectángulo (página, x, y, w, h, dx, dy, ancho, alto) de cada frame y sus
+    # duraciones. w x h es lo guardado en el atlas, a (dx, dy) dentro del frame completo de ancho x alto.
+    # Los frames repetidos comparten rectángulo
+    pil_frames, frame_map, durations = decode_frames(path, max_width, max_height)
+    full_sizes = [im.size for im in pil_frames]
+    offsets = [(0, 0)] * len(pil_frames)
+    if trim:
+        pil_frames, offsets = zip(*(trim_frame(im) for im in pil_frames))
+    stored, page_sizes = pack_atlas([im.size for im in pil_frames])
+    pil_pages = build_atlas_pages(pil_frames, stored, page_sizes)
+    pages = [(page.size[0], page.size[1], page.tobytes()) for page in pil_pages]
+    rects = [stored[i] + offsets[i] + full_sizes[i] for i in frame_map]
+    return pages, rects, durations
+
+def scaled_size(size, scale):
+    return None if size is None else max(1, int(size * scale))
+
+def sprite_variants(gif_mapping=None):
+    # (ruta, max_width, max_height) de lo que la aplicación llega a cargar: las imágenes de Gif_mapping con sus
+    # tamaños y la explosión a tamaño original. Las imágenes de img/ sin tecla no entran en el pack
+    gif_mapping = Gif_mapping if gif_mapping is None else gif_mapping
+    requested = [(info['path'], info.get('max_width'), info.get('max_height')) for info in gif_mapping.values()]
+    variants = set()
+    for path, max_width, max_height in requested:
+        if not os.path.isfile(path):
+            continue
+        # También los tamaños reducidos que pide el QualityGovernor en los niveles bajos
+        for scale in {level['spawn_scale'] for level in QUALITY_LEVELS}:
+            variants.add((path, scaled_size(max_width, scale), scaled_size(max_height, scale)))
+    if os.path.isfile(EXPLOSION_IMAGE):
+        variants.add((EXPLOSION_IMAGE, None, None))
+    return sorted(variants, key=str)
+
+def pack_checksum(gif_mapping=None):
+    # Huella de las fuentes (tamaño y fecha) y de la configuración: si cambia, el pack está desactualizado
+    sources = [(atlas_key(*variant), source_stamp(variant[0])) for variant in sprite_variants(gif_mapping)]
+    sources += [(os.path.abspath(bg), source_stamp(bg)) for bg in Backgrounds if os.path.exists(bg)]
+    data = json.dumps([AssetPack.VERSION, ATLAS_TRIM, sources]).encode()
+    return hashlib.sha1(data).hexdigest()
+
+class AssetPack:
+    # Fichero único con todos los assets en RGBA crudo: cabecera, bloques de píxeles alineados y un índice
+    # JSON al final. Se abre con mmap y los buffers que devuelve son vistas del mapeo, sin copias
+    MAGIC = b'SBPK'
+    VERSION = 2
+    HEADER = struct.Struct('<4sIQQ')  # magic, versión, offset y longitud del índice
+    ALIGN = 64
+
+    def __init__(self, path=ASSET_PACK):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, index_offset, index_len = self.HEADER.unpack_from(self._mmap, 0)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError(f"{path} no es un pack de assets v{self.VERSION}")
+            self.index = json.loads(self._mmap[index_offset:index_offset + index_len])
+        except Exception:
+            self._file.close()
+            raise
+        self.checksum = self.index['checksum']
+
+    def _pixels(self, width, height, offset):
+        return memoryview(self._mmap)[offset:offset + width * height * 4]
+
+    def asset(self, path, max_width=None, max_height=None):
+        # Mismo formato que decode_asset, o None si no está en el pack o la fuente cambió después
+        packed = self.index['assets'].get(atlas_key(path, max_width, max_height))
+        if packed is None or not os.path.exists(path) or packed['source'] != source_stamp(path):
+            return None
+        pages = [(w, h, self._pixels(w, h, offset)) for w, h, offset in packed['pages']]
+        return pages, [tuple(rect) for rect in packed['rects']], packed['durations']
+
+    def background(self, path):
+        packed = self.index['backgrounds'].get(os.path.abspath(path))
+        if packed is None or not os.path.exists(path) or packed['source'] != source_stamp(path):
+            return None
+        width, height, offset = packed['page']
+        return width, height, self._pixels(width, height, offset)
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # Aún hay texturas pendientes de subir desde el mapeo; se cierra al salir del proceso
+        self._file.close()
+
+    @classmethod
+    def build(cls, path=ASSET_PACK, gif_mapping=None, workers=DECODE_WORKERS):
+        # Decodifica y redimensiona todo en paralelo y lo escribe a un temporal que sustituye al pack al final
+        variants = sprite_variants(gif_mapping)
+        backgrounds = [bg for bg in Backgrounds if os.path.isfile(bg) and not is_animated_background(bg)]
+        index = {'checksum': pack_checksum(gif_mapping), 'assets': {}, 'backgrounds': {}}
+        tmp_path = path + '.tmp'
+
+        def write_pixels(f, data):
+            f.write(b'\0' * (-f.tell() % cls.ALIGN))
+            offset = f.tell()
+            f.write(data)
+            return offset
+
+        with open(tmp_path, 'wb') as f, ProcessPoolExecutor(max_workers=workers) as executor:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, 0, 0))
+            jobs = [executor.submit(decode_asset, *variant) for variant in variants]
+            for (asset_path, max_width, max_height), job in zip(variants, jobs):
+                try:
+                    pages, rects, durations = job.result()
+                except Exception as e:
+                    print(f"Error abriendo imagen {asset_path}: {e}")
+                    continue
+                index['assets'][atlas_key(asset_path, max_width, max_height)] = {
+                    'source': source_stamp(asset_path),
+                    'pages': [(w, h, write_pixels(f, data)) for w, h, data in pages],
+                    'rects': rects,
+                    'durations': durations,
+                }
+                print(f"{asset_path} ({max_width}x{max_height}): {len(rects)} frames en {len(pages)} página(s)")
+            for bg in backgrounds:
+                img = Image.open(bg).convert('RGBA')
+                index['backgrounds'][os.path.abspath(bg)] = {
+                    'source': source_stamp(bg),
+                    'page': (img.size[0], img.size[1], write_pixels(f, img.tobytes())),
+                }
+            if variants and not index['assets']:
+                raise RuntimeError("no se pudo decodificar ningún asset")
+            index_data = json.dumps(index).encode()
+            index_offset = f.tell()
+            f.write(index_data)
+            f.seek(0)
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, index_offset, len(index_data)))
+        os.replace(tmp_path, path)
+
+def load_asset_pack(path=ASSET_PACK, gif_mapping=None, rebuild=True):
+    # Abre el pack; si falta o su checksum no coincide con las fuentes lo reconstruye (o None si no se puede)
+    try:
+        checksum = pack_checksum(gif_mapping)
+    except OSError as e:
+        print(f"No se pueden leer los assets: {e}")
+        return None
+    pack = None
+    if os.path.exists(path):
+        try:
+            pack = AssetPack(path)
+        except (OSError, ValueError, struct.error) as e:
+            # Pack corrupto o truncado: se reconstruye (o se cargan las imágenes sueltas)
+            print(f"No se pudo abrir el pack de assets {path}: {e}")
+    if pack is not None:
+        if pack.checksum == checksum:
+            return pack
+        pack.close()
+    if not rebuild:
+        return None
+    print(f"Pack de assets {path} ausente o desactualizado, reconstruyendo...")
+    try:
+        AssetPack.build(path, gif_mapping)
+        return AssetPack(path)
+    except Exception as e:
+        print(f"No se pudo construir el pack de assets: {e}")
+        return None
+
+class DecodePool:
+    # Pool acotado de procesos (el redimensionado corre en paralelo de verdad, sin el GIL) con cola
+    # por prioridad. Una sola tarea por entrada de caché: pedir el mismo asset otra vez no encola nada.
+    # Las peticiones que aún no han llegado a un proceso se pueden cancelar
+    def __init__(self, workers=DECODE_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._queue = []  # heap de [prioridad, orden, entrada, cancelada]
+        self._queued = {}
+        self._running = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def warm_up(self):
+        # Arranca los procesos antes de la primera tecla para no pagar su arranque en el primer spawn
+        for _ in range(self.workers):
+            self._get_executor().submit(os.getpid)
+
+    def submit(self, entry, priority=PRIORITY_SPAWN):
+        with self._lock:
+            if entry in self._running:
+                return
+            item = self._queued.get(entry)
+            if item is not None:
+                if priority >= item[0]:
+                    return
+                item[3] = True  # Sube de prioridad: la entrada vieja del heap se ignora al sacarla
+            item = [priority, next(self._seq), entry, False]
+            self._queued[entry] = item
+            heapq.heappush(self._queue, item)
+        self._dispatch()
+
+    def cancel(self, entry):
+        # True si la petición no había empezado y ya no se hará
+        with self._lock:
+            item = self._queued.pop(entry, None)
+            if item is None:
+                return False
+            item[3] = True
+            return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._queued) + len(self._running)
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if len(self._running) >= self.workers or not self._queue:
+                    return
+                item = heapq.heappop(self._queue)
+                if item[3]:
+                    continue
+                entry = item[2]
+                del self._queued[entry]
+                future = self._get_executor().submit(decode_asset, entry.path, entry.max_width, entry.max_height)
+                self._running[entry] = future
+            future.add_done_callback(lambda f, entry=entry: self._on_done(entry, f))
+
+    def _on_done(self, entry, future):
+        with self._lock:
+            self._running.pop(entry, None)
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            self._executor = None
+            entry.fail_loading(e)
+        except Exception as e:
+            entry.fail_loading(e)
+        else:
+            entry.finish_loading(result)
+        self._dispatch()
+
+    def shutdown(self):
+        with self._lock:
+            self._queue = []
+            self._queued = {}
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+class TextureCacheEntry:
+    # Frames de un asset empaquetados en páginas de atlas, compartidos por todos los sprites que lo usan.
+    # frames[i] es la textura de la página del frame i, uvs[i] su rectángulo (u0, v0, u1, v1), sizes[i] el
+    # tamaño del frame completo y crops[i] = (dx, dy, w, h) la parte guardada (sin bordes transparentes)
+    def __init__(self, key):
+        self.key = key
+        self.path, self.max_width, self.max_height = key
+        self.pages = []
+        self.frames = []
+        self.sizes = []
+        self.uvs = []
+        self.crops = []
+        self.durations = []
+        self.cumulative = []  # cumulative[i] = instante (s) en que termina el frame i dentro del bucle
+        self.total_duration = DEFAULT_FRAME_DURATION
+        self.refcount = 0
+        self.decoded = False
+        self.failed = False
+        self.uploaded = False
+        self._pages_raw = []
+        self._rects = []
+        self._upload_rows = None  # Fila por la que va la subida de cada página, None si no ha empezado
+        self._waiters = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def add_waiter(self, callback):
+        # Si ya está decodificado (o falló) se llama en el acto; si no, cuando termine la decodificación.
+        # Con failed a True el callback tiene que descartar lo que esperaba la entrada
+        with self._lock:
+            if not self.decoded and not self.failed:
+                self._waiters.append(callback)
+                return
+        callback(self)
+
+    def load(self):
+        # Decodificación en el hilo actual, sin pasar por el pool
+        try:
+            result = decode_asset(self.path, self.max_width, self.max_height)
+        except Exception as e:
+            self.fail_loading(e)
+            return
+        self.finish_loading(result)
+
+    def fail_loading(self, error):
+        print(f"Error abriendo imagen {self.path}: {error}")
+        with self._lock:
+            self.failed = True
+            waiters, self._waiters = self._waiters, []
+        self._done.set()
+        for callback in waiters:
+            callback(self)
+
+    def finish_loading(self, result):
+        pages, rects, durations = result
+        self.set_durations(durations)
+        with self._lock:
+            self._pages_raw = pages
+            self._rects = [tuple(rect) for rect in rects]
+            self.decoded = True
+            waiters, self._waiters = self._waiters, []
+        self._done.set()
+        for callback in waiters:
+            callback(self)
+
+    def set_durations(self, durations):
+        self.durations = list(durations)
+        self.cumulative = []
+        elapsed = 0.0
+        for duration in self.durations:
+            elapsed += duration
+            self.cumulative.append(elapsed)
+        self.total_duration = elapsed or DEFAULT_FRAME_DURATION
+
+    def frame_at(self, t):
+        # Frame que toca en el instante t (s) desde que empezó a reproducirse, en bucle
+        index = bisect.bisect_right(self.cumulative, t % self.total_duration)
+        return min(index, len(self.cumulative) - 1)
+
+    @property
+    def uploading(self):
+        return self._upload_rows is not None
+
+    def upload(self):
+        # Solo en el hilo principal (contexto GL). Sube de golpe lo que falte de todas las páginas
+        while self.decoded and not self.uploaded:
+            self.upload_step()
+
+    def upload_step(self, max_bytes=None, pbo=None):
+        # Sube filas de las páginas hasta max_bytes (todo si es None); al menos una fila para avanzar siempre.
+        # Devuelve los bytes subidos. Las texturas se crean vacías la primera vez y se rellenan por tramos
+        if self.uploaded or not self.decoded:
+            return 0
+        if self._upload_rows is None:
+            self.pages = [create_texture(None, page_w, page_h) for page_w, page_h, _ in self._pages_raw]
+            self._upload_rows = [0] * len(self.pages)
+        sent = 0
+        for i, (page_w, page_h, data) in enumerate(self._pages_raw):
+            row = self._upload_rows[i]
+            if row >= page_h:
+                continue
+            row_bytes = page_w * 4
+            rows = page_h - row
+            if max_bytes is not None:
+                rows = max(1, min(rows, (max_bytes - sent) // row_bytes))
+            pixels = np.frombuffer(data, dtype=np.uint8, count=rows * row_bytes, offset=row * row_bytes)
+            upload_texture_rows(self.pages[i], row, page_w, rows, pixels, pbo)
+            self._upload_rows[i] = row + rows
+            sent += rows * row_bytes
+            if max_bytes is not None and sent >= max_bytes:
+                break
+        if all(row >= page_h for row, (_, page_h, _) in zip(self._upload_rows, self._pages_raw)):
+            self._finish_upload()
+        return sent
+
+    def _finish_upload(self):
+        for page, x, y, w, h, dx, dy, full_w, full_h in self._rects:
+            page_w, page_h, _ = self._pages_raw[page]
+            self.frames.append(self.pages[page])
+            self.sizes.append((full_w, full_h))
+            self.crops.append((dx, dy, w, h))
+            self.uvs.append((x / page_w, y / page_h, (x + w) / page_w, (y + h) / page_h))
+        self._pages_raw = []
+        self._upload_rows = None
+        self.uploaded = True
+
+    def wait_decoded(self):
+        self._done.wait()
+        return self.decoded
+
+    def free(self):
+        delete_textures(self.pages)
+        self.pages = []
+        self.frames = []
+        self.sizes = []
+        self.uvs = []
+        self.crops = []
+        self.uploaded = False
+        self._upload_rows = None
+        # Expulsada de la caché: sin datos que subir aunque el uploader aún la tenga en cola
+        self._pages_raw = []
+        self.decoded = False
+
+
+class TextureCache:
+    # Caché de texturas por (ruta, max_width, max_height) con contador de referencias.
+    # Las entradas sin referencias se quedan en una LRU y se liberan al superar max_unused
+    def __init__(self, max_unused=8, decode_pool=None, asset_pack=None):
+        self.entries = {}
+        self.unused = OrderedDict()
+        self.max_unused = max_unused
+        self.asset_pack = asset_pack
+        self.decode_pool = decode_pool or DecodePool()
+
+    def acquire(self, path, max_width=None, max_height=None, synchronous=False, priority=PRIORITY_SPAWN):
+        # synchronous=True decodifica y sube en el hilo actual (solo desde el hilo GL)
+        key = (path, max_width, max_height)
+        entry = self.entries.get(key)
+        if entry is None or entry.failed:
+            entry = TextureCacheEntry(key)
+            self.entries[key] = entry
+            packed = self.asset_pack.asset(*key) if self.asset_pack else None
+            if packed is not None:
+                # Ya está en RGBA crudo en el pack: se sube directamente desde el mapeo
+                entry.finish_loading(packed)
+            elif synchronous:
+                entry.load()
+            else:
+                self.decode_pool.submit(entry, priority)
+        elif not entry.decoded and not synchronous:
+            # Ya pedida (p. ej. por prefetch): si sigue en la cola, sube a la prioridad de este spawn
+            self.decode_pool.submit(entry, priority)
+        entry.refcount += 1
+        self.unused.pop(key, None)
+        if synchronous and entry.wait_decoded():
+            entry.upload()
+        return entry
+
+    def prefetch(self, path, max_width=None, max_height=None):
+        # Decodificación por adelantado con prioridad baja y sin referencia: queda en la LRU de no usadas
+        # y cualquier spawn se decodifica antes. Lo que ya está en el pack no hace falta
+        key = (path, max_width, max_height)
+        entry = self.entries.get(key)
+        if entry is not None and not entry.failed:
+            return
+        if self.asset_pack is not None and self.asset_pack.asset(*key) is not None:
+            return
+        entry = TextureCacheEntry(key)
+        self.entries[key] = entry
+        self.decode_pool.submit(entry, PRIORITY_PREFETCH)
+        self.unused[key] = entry
+        self.evict()
+
+    def release(self, entry):
+        if entry.refcount <= 0:
+            return
+        entry.refcount -= 1
+        if entry.refcount == 0 and self.entries.get(entry.key) is entry:
+            if not entry.decoded and self.decode_pool.cancel(entry):
+                # Nadie la espera y aún no había empezado a decodificarse: fuera de la caché
+                del self.entries[entry.key]
+                entry.failed = True
+                entry._done.set()
+                return
+            self.unused[entry.key] = entry
+            self.evict()
+
+    def evict(self):
+        # Solo se expulsan entradas que terminaron de decodificar: las demás siguen en el pool
+        while len(self.unused) > self.max_unused:
+            for key, entry in self.unused.items():
+                if entry.decoded or entry.failed:
+                    break
+            else:
+                return
+            del self.unused[key]
+            del self.entries[key]
+            entry.free()
+
+    def clear(self):
+        for entry in self.entries.values():
+            entry.free()
+        self.entries = {}
+        self.unused = OrderedDict()
+
+
+class SpriteArrays:
+    # Estado de todos los sprites en arrays NumPy (estructura de arrays).
+    # Cada BouncingGIF es una vista sobre una fila; step(dt) avanza todas las filas de golpe.
+    # Velocidades en píxeles por segundo y animación por tiempo transcurrido, no por ticks
+    FLOAT_FIELDS = ('x', 'y', 'dx', 'dy', 'rotate_angle', 'anchor_x', 'anchor_y', 'anim_time', 'anim_start', 'anim_total',
+                    'offset_x', 'offset_y')
+    INT_FIELDS = ('width', 'height', 'index', 'frame_count', 'frame_base', 'stuck_to', 'screen_width', 'screen_height', 'group')
+    BOOL_FIELDS = ('ready', 'rotate_enabled', 'gpu')
+    # stuck_to: -1 libre, >= 0 fila a la que se pegó, -2 raíz de un grupo cuya raíz anterior se eliminó
+    # (posición congelada en anchor_x/anchor_y).
+    # Grupos de pegados (union-find con listas de miembros): group[fila] es siempre directamente la raíz del
+    # grupo, que es la que se mueve; los demás miembros van a offset_x/offset_y de ella, como un sólido.
+    # members[raíz] lista los miembros de los grupos de más de uno en orden de unión (la raíz primero).
+    # gpu: fila que mueve y dibuja el GPUSpriteLayer; step() y el SpriteBatch la saltan
+    STUCK_TO_REMOVED = -2
+    FRAME_TABLE_SLACK = 256  # Frames de assets ya liberados que se toleran en la tabla antes de compactarla
+
+    def __init__(self, capacity=64):
+        self.capacity = 0
+        for name in self.FLOAT_FIELDS:
+            setattr(self, name, np.zeros(0, dtype=np.float64))
+        for name in self.INT_FIELDS:
+            setattr(self, name, np.zeros(0, dtype=np.int64))
+        for name in self.BOOL_FIELDS:
+            setattr(self, name, np.zeros(0, dtype=bool))
+        self.parents = []  # Objeto al que se pegó cada fila (también si ya fue eliminado)
+        self.members = {}
+        self.free_slots = []
+        self.used = 0
+        # Tabla de frames de todos los assets: frame_w/frame_h/frame_tex[frame_base + index].
+        # frame_end guarda el final de cada frame en una línea de tiempo común y creciente: el asset
+        # empieza en anim_start, así un único searchsorted (bisect vectorizado) resuelve el frame de todos
+        self.frame_end = np.zeros(0, dtype=np.float64)
+        self._timeline_end = 0.0
+        self.frame_w = np.zeros(0, dtype=np.int64)
+        self.frame_h = np.zeros(0, dtype=np.int64)
+        self.frame_tex = np.zeros(0, dtype=np.int64)
+        self.frame_uv = np.zeros((0, 4), dtype=np.float32)
+        self.frame_crop = np.zeros((0, 4), dtype=np.float32)
+        self._frame_bases = weakref.WeakKeyDictionary()  # entrada -> (frame_base, número de frames)
+        self.frames_version = 0  # Sube al compactar la tabla: cambian frame_base y anim_start de las filas
+        self._detached = None
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        for name in self.FLOAT_FIELDS + self.INT_FIELDS + self.BOOL_FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self.parents.extend([None] * (capacity - self.capacity))
+        self.capacity = capacity
+
+    def alloc(self, screen_width, screen_height):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            if self.used == self.capacity:
+                self._grow(max(64, self.capacity * 2))
+            slot = self.used
+            self.used += 1
+        self.x[slot] = self.y[slot] = 0
+        self.dx[slot] = self.dy[slot] = 0
+        self.rotate_angle[slot] = 0
+        self.anim_time[slot] = 0
+        self.anim_start[slot] = 0
+        self.anim_total[slot] = DEFAULT_FRAME_DURATION
+        self.screen_width[slot] = screen_width
+        self.screen_height[slot] = screen_height
+        self.width[slot] = self.height[slot] = 1
+        self.index[slot] = 0
+        self.frame_count[slot] = 1
+        self.frame_base[slot] = 0
+        self.stuck_to[slot] = -1
+        self.group[slot] = slot
+        self.offset_x[slot] = self.offset_y[slot] = 0
+        self.ready[slot] = False
+        self.rotate_enabled[slot] = False
+        self.gpu[slot] = False
+        self.parents[slot] = None
+        return slot
+
+    def attach(self, child, parent, parent_obj=None):
+        # Une el grupo de child al de parent: child queda justo a la derecha de parent y el resto de su grupo
+        # se traslada con él sin deformarse. A partir de ahí se mueven con la raíz del grupo de parent
+        root = int(self.group[parent])
+        old_root = int(self.group[child])
+        if root == old_root:
+            return
+        shift_x = self.x[parent] + self.width[parent] - self.x[child]
+        shift_y = self.y[parent] - self.y[child]
+        moved = self.members.pop(old_root, [old_root])
+        for member in moved:
+            self.x[member] += shift_x
+            self.y[member] += shift_y
+            self.offset_x[member] = self.x[member] - self.x[root]
+            self.offset_y[member] = self.y[member] - self.y[root]
+            self.group[member] = root
+            self.dx[member] = self.dx[root]
+            self.dy[member] = self.dy[root]
+        for member in {old_root, child}:
+            self.stuck_to[member] = parent
+            self.parents[member] = parent_obj
+        self.members.setdefault(root, [root]).extend(moved)
+
+    def split(self, slot):
+        # Saca la fila de su grupo y la deja libre donde está
+        self.stuck_to[slot] = -1
+        self.parents[slot] = None
+        self._leave_group(slot, anchor=False)
+
+    def _leave_group(self, slot, anchor):
+        root = int(self.group[slot])
+        members = self.members.pop(root, None)
+        self.group[slot] = slot
+        self.offset_x[slot] = self.offset_y[slot] = 0
+        if members is None:
+            return
+        members.remove(slot)
+        if slot != root:
+            if len(members) > 1:
+                self.members[root] = members
+            return
+        # Sale la raíz: el primer miembro que queda pasa a ser la raíz y los offsets se rehacen respecto a él.
+        # Si la raíz se eliminó (anchor) el grupo se queda congelado donde estaba
+        new_root = members[0]
+        for member in members:
+            self.group[member] = new_root
+            self.offset_x[member] = self.x[member] - self.x[new_root]
+            self.offset_y[member] = self.y[member] - self.y[new_root]
+        if len(members) > 1:
+            self.members[new_root] = members
+        if anchor:
+            self.stuck_to[new_root] = self.STUCK_TO_REMOVED
+            self.anchor_x[new_root] = self.x[new_root]
+            self.anchor_y[new_root] = self.y[new_root]
+        else:
+            self.stuck_to[new_root] = -1
+            self.parents[new_root] = None
+
+    def free(self, slot):
+        # Si estaba en un grupo, el resto se queda congelado (sin la raíz) o sigue moviéndose (sin un miembro).
+        # Los que se pegaron a esta fila dejan de apuntar a su objeto, que el GIFManager puede reutilizar
+        for member in self.members.get(int(self.group[slot]), ()):
+            if self.stuck_to[member] == slot:
+                self.parents[member] = None
+        self._leave_group(slot, anchor=True)
+        self.ready[slot] = False
+        self.stuck_to[slot] = -1
+        self.parents[slot] = None
+        self.free_slots.append(slot)
+
+    def detached(self):
+        # Fila única y nunca lista a la que pasan los GIFs eliminados hasta que se reutilizan: si alguien los
+        # lee no toca su fila antigua, que ya puede ser de otro sprite. Se comparte para no crear arrays al quitar
+        if self._detached is None:
+            self._detached = SpriteArrays(capacity=1)
+            self._detached.alloc(0, 0)
+        return self._detached
+
+    def _compact_frames(self):
+        # Quita de la tabla los frames de los assets liberados (expulsados de la caché o ya recolectados) y
+        # recoloca frame_base y anim_start de las filas, sin cambiar el punto de la animación en que están
+        old_end = self.frame_end
+        live = sorted((base, count, entry) for entry, (base, count) in self._frame_bases.items() if entry.sizes)
+        base_map = np.full(len(old_end), -1, dtype=np.int64)
+        shift = np.zeros(len(old_end), dtype=np.float64)
+        keep = np.zeros(len(old_end), dtype=bool)
+        bases = weakref.WeakKeyDictionary()
+        new_base = 0
+        start = 0.0
+        for base, count, entry in live:
+            base_map[base] = new_base
+            shift[base] = start - (old_end[base] - entry.cumulative[0])
+            shift[base:base + count] = shift[base]
+            keep[base:base + count] = True
+            bases[entry] = (new_base, count)
+            new_base += count
+            start += entry.total_duration
+        self.frame_end = old_end[keep] + shift[keep]
+        self._timeline_end = start
+        for name in ('frame_w', 'frame_h', 'frame_tex', 'frame_uv', 'frame_crop'):
+            setattr(self, name, getattr(self, name)[keep])
+        self._frame_bases = bases
+        # Las filas libres o sin asset pueden apuntar a frames quitados: vuelven a 0 (no se animan hasta set_frames)
+        rows = np.arange(self.used)
+        old_base = self.frame_base[rows]
+        mapped = base_map[old_base]
+        self.anim_start[rows] += np.where(mapped >= 0, shift[old_base], 0.0)
+        self.frame_base[rows] = np.maximum(mapped, 0)
+        self.frames_version += 1
+
+    def set_frames(self, slot, entry):
+        known = self._frame_bases.get(entry)
+        if known is None:
+            live = sum(count for other, (_, count) in self._frame_bases.items() if other.sizes)
+            if len(self.frame_w) - live > max(live, self.FRAME_TABLE_SLACK):
+                self._compact_frames()
+            base = len(self.frame_w)
+            start = self._timeline_end
+            self.frame_end = np.concatenate([self.frame_end, start + np.array(entry.cumulative, dtype=np.float64)])
+            self._timeline_end = start + entry.total_duration
+            self.frame_w = np.concatenate([self.frame_w, np.array([w for w, _ in entry.sizes], dtype=np.int64)])
+            self.frame_h = np.concatenate([self.frame_h, np.array([h for _, h in entry.sizes], dtype=np.int64)])
+            self.frame_tex = np.concatenate([self.frame_tex, np.array(entry.frames, dtype=np.int64)])
+            self.frame_uv = np.concatenate([self.frame_uv, np.array(entry.uvs, dtype=np.float32).reshape(-1, 4)])
+            crops = entry.crops or [(0, 0, w, h) for w, h in entry.sizes]
+            self.frame_crop = np.concatenate([self.frame_crop, np.array(crops, dtype=np.float32).reshape(-1, 4)])
+            self._frame_bases[entry] = (base, len(entry.sizes))
+        else:
+            base = known[0]
+        self.frame_base[slot] = base
+        self.frame_count[slot] = len(entry.sizes)
+        self.anim_start[slot] = self.frame_end[base] - entry.cumulative[0]
+        self.anim_total[slot] = entry.total_duration
+        self.anim_time[slot] = 0
+        self.index[slot] = 0
+        self.width[slot] = self.frame_w[base]
+        self.height[slot] = self.frame_h[base]
+
+    def step(self, order, dt, animate=True, rotate=True):
+        # order: filas en el orden de active_gifs. animate=False solo avanza el reloj de animación sin
+        # cambiar de frame y rotate=False congela el ángulo (niveles bajos del QualityGovernor)
+        rows = order[self.ready[order] & ~self.gpu[order]]
+        if len(rows) == 0:
+            return
+        # Frame según el tiempo transcurrido y las duraciones del GIF, y su tamaño
+        anim_time = self.anim_time[rows] + dt
+        self.anim_time[rows] = anim_time
+        if animate:
+            t = self.anim_start[rows] + np.mod(anim_time, self.anim_total[rows])
+            index = np.searchsorted(self.frame_end, t, side='right') - self.frame_base[rows]
+            index = np.minimum(index, self.frame_count[rows] - 1)
+            self.index[rows] = index
+            self.width[rows] = self.frame_w[self.frame_base[rows] + index]
+            self.height[rows] = self.frame_h[self.frame_base[rows] + index]
+        # Solo se mueven las raíces de grupo (los sprites sueltos son grupos de uno). Rebotan con la caja
+        # que envuelve a todo el grupo; si el grupo es más ancho o alto que la pantalla, con la de la raíz
+        group = self.group[rows]
+        is_root = group == rows
+        roots = rows[is_root]
+        members = rows[~is_root]
+        stuck = self.stuck_to[roots]
+        free = roots[stuck == -1]
+        left = np.zeros(self.capacity)
+        top = np.zeros(self.capacity)
+        right = self.width.astype(np.float64)
+        bottom = self.height.astype(np.float64)
+        if len(members):
+            member_groups = group[~is_root]
+            np.minimum.at(left, member_groups, self.offset_x[members])
+            np.minimum.at(top, member_groups, self.offset_y[members])
+            np.maximum.at(right, member_groups, self.offset_x[members] + self.width[members])
+            np.maximum.at(bottom, member_groups, self.offset_y[members] + self.height[members])
+        screen_w = self.screen_width[free]
+        screen_h = self.screen_height[free]
+        wide = right[free] - left[free] >= screen_w
+        tall = bottom[free] - top[free] >= screen_h
+        left_f = np.where(wide, 0, left[free])
+        right_f = np.where(wide, self.width[free], right[free])
+        top_f = np.where(tall, 0, top[free])
+        bottom_f = np.where(tall, self.height[free], bottom[free])
+        dx = self.dx[free]
+        dy = self.dy[free]
+        x = self.x[free] + dx * dt
+        y = self.y[free] + dy * dt
+        self.x[free] = x
+        self.y[free] = y
+        # Solo se invierte la velocidad si va hacia el borde que toca: así no se queda vibrando contra él
+        bounce_x = ((x + left_f <= 0) & (dx < 0)) | ((x + right_f >= screen_w) & (dx > 0))
+        bounce_y = ((y + top_f <= 0) & (dy < 0)) | ((y + bottom_f >= screen_h) & (dy > 0))
+        self.dx[free] = np.where(bounce_x, -dx, dx)
+        self.dy[free] = np.where(bounce_y, -dy, dy)
+        if rotate:
+            rotating = free[self.rotate_enabled[free]]
+            self.rotate_angle[rotating] = (self.rotate_angle[rotating] + ROTATION_SPEED * dt) % 360
+        # Grupos cuya raíz se eliminó: posición congelada
+        anchored = roots[stuck == self.STUCK_TO_REMOVED]
+        self.x[anchored] = self.anchor_x[anchored]
+        self.y[anchored] = self.anchor_y[anchored]
+        # Miembros: posición relativa fija a la raíz ya movida en este paso, sin retraso aunque la cadena sea larga
+        if len(members):
+            parents = group[~is_root]
+            self.x[members] = self.x[parents] + self.offset_x[members]
+            self.y[members] = self.y[parents] + self.offset_y[members]
+            self.dx[members] = self.dx[parents]
+            self.dy[members] = self.dy[parents]
+
+
+def _sprite_field(name, cast):
+    def fget(self):
+        return cast(getattr(self._arrays, name)[self._slot])
+    def fset(self, value):
+        getattr(self._arrays, name)[self._slot] = value
+    return property(fget, fset)
+
+
 class BouncingGIF:
-    def __init__(self, gif_path, screen_width, screen_height, on_ready=None, stick_on_collision=False, max_width=None, max_height=None, colision_tipo=None):
+    # Vista ligera sobre una fila de SpriteArrays: el estado vive en los arrays del GIFManager.
+    # Con __slots__ y sin __dict__; el GIFManager reutiliza los objetos liberados con reset()
+    __slots__ = ('entry', '_arrays', '_slot', 'frames', 'sizes', '_on_ready', 'stick_on_collision',
+                 'max_width', 'max_height', 'colision_tipo', '_rng')
+    x = _sprite_field('x', float)
+    y = _sprite_field('y', float)
+    dx = _sprite_field('dx', float)
+    dy = _sprite_field('dy', float)
+    width = _sprite_field('width', int)
+    height = _sprite_field('height', int)
+    index = _sprite_field('index', int)
+    rotate_angle = _sprite_field('rotate_angle', float)
+    rotate_enabled = _sprite_field('rotate_enabled', bool)
+    ready = _sprite_field('ready', bool)
+    screen_width = _sprite_field('screen_width', int)
+    screen_height = _sprite_field('screen_height', int)
+
+    def __init__(self, entry, sprites, screen_width, screen_height, on_ready=None, stick_on_collision=False, colision_tipo=None,
+                 rng=None):
+        self.reset(entry, sprites, screen_width, screen_height, on_ready, stick_on_collision, colision_tipo, rng)
+
+    def reset(self, entry, sprites, screen_width, screen_height, on_ready=None, stick_on_collision=False, colision_tipo=None,
+              rng=None):
+        # rng: random.Random del GIFManager (con semilla); sin él, el módulo random
+        self._rng = rng or random
+        self.entry = entry
+        self._arrays = sprites
+        self._slot = sprites.alloc(screen_width, screen_height)
         self.frames = []
         self.sizes = []
-        self.index = 0
-        self.width = 1
-        self.height = 1
-        self.x = 0
-        self.y = 0
-        self.dx = random.choice([-5, 5])
-        self.dy = random.choice([-5, 5])
-        self.ready = False
-        self.rotate_angle = 0
-        self.rotate_enabled = False
-        self._gif_path = gif_path
+        self.dx = self._rng.choice([-SPRITE_SPEED, SPRITE_SPEED])
+        self.dy = self._rng.choice([-SPRITE_SPEED, SPRITE_SPEED])
         self._on_ready = on_ready
-        self._pil_frames = []
-        self.screen_width = screen_width
-        self.screen_height = screen_height
         self.stick_on_collision = stick_on_collision
-        self.stuck_to = None  # Referencia a otro GIF si está pegado
-        self.max_width = max_width
-        self.max_height = max_height
+        self.max_width = entry.max_width
+        self.max_height = entry.max_height
         self.colision_tipo = colision_tipo
         # Si es piolet, siempre rota
         if self.colision_tipo == 'piolet':
             self.rotate_enabled = True
-        threading.Thread(target=self._load_gif_pil_frames, daemon=True).start()
 
-    def _load_gif_pil_frames(self):
-        try:
-            img = Image.open(self._gif_path)
-        except Exception as e:
-            print(f"Error abriendo imagen {self._gif_path}: {e}")
+    @property
+    def stuck_to(self):
+        # Referencia a otro GIF si está pegado
+        if self._arrays.stuck_to[self._slot] == -1:
+            return None
+        return self._arrays.parents[self._slot]
+
+    @stuck_to.setter
+    def stuck_to(self, other):
+        # Pegarse a otro GIF une los dos grupos; None lo saca de su grupo
+        if other is None:
+            self._arrays.split(self._slot)
+            return
+        self._arrays.attach(self._slot, other._slot, other)
+
+    def _entry_decoded(self, entry):
+        # Un aviso de la entrada anterior si el objeto se liberó y se reutilizó antes de que acabara
+        if entry is not self.entry:
             return
-        try:
-            n_frames = getattr(img, 'n_frames', 1)
-        except Exception:
-            n_frames = 1
-        def resize_if_needed(im):
-            w, h = im.size
-            scale = 1.0
-            if self.max_width is not None and w > self.max_width:
-                scale = min(scale, self.max_width / w)
-            if self.max_height is not None and h > self.max_height:
-                scale = min(scale, self.max_height / h)
-            if scale < 1.0:
-                new_w = max(1, int(w * scale))
-                new_h = max(1, int(h * scale))
-                return im.resize((new_w, new_h), Image.LANCZOS)
-            return im
-        if n_frames > 1:
-            for frame in range(n_frames):
-                img.seek(frame)
-                frame_img = img.convert('RGBA').copy()
-                frame_img = resize_if_needed(frame_img)
-                self._pil_frames.append(frame_img)
-        else:
-            frame_img = img.convert('RGBA').copy()
-            frame_img = resize_if_needed(frame_img)
-            self._pil_frames.append(frame_img)
         if self._on_ready:
             self._on_ready(self)
 
-    def init_textures(self):
-        for frame_img in self._pil_frames:
-            tex_id, w, h = GIFManager.load_texture_from_pil(frame_img)
-            self.frames.append(tex_id)
-            self.sizes.append((w, h))
-        self.index = 0
-        self.width, self.height = self.sizes[0]
-        max_x = max(0, self.screen_width - self.width)
-        max_y = max(0, self.screen_height - self.height)
-
-        # Nueva lógica: evitar que los GIFs aparezcan demasiado cerca entre sí
-        min_distance = 150  # Distancia mínima en píxeles
-        max_attempts = 50
-        placed = False
-        for _ in range(max_attempts):
-            candidate_x = random.randint(0, max_x)
-            candidate_y = random.randint(0, max_y)
-            too_close = False
-            # Buscar otros GIFs activos
-            from inspect import currentframe, getouterframes
-            # Buscar el GIFManager activo en la pila de llamadas
-            gif_manager = None
-            for frameinfo in getouterframes(currentframe()):
-                local_gm = frameinfo.frame.f_locals.get('self', None)
-                if hasattr(local_gm, 'active_gifs'):
-                    gif_manager = local_gm
-                    break
-            if gif_manager:
-                all_gifs = [g for glist in gif_manager.active_gifs.values() for g in glist if g is not self and hasattr(g, 'x') and hasattr(g, 'y')]
-                for other in all_gifs:
-                    dx = (candidate_x + self.width/2) - (other.x + other.width/2)
-                    dy = (candidate_y + self.height/2) - (other.y + other.height/2)
-                    dist = (dx**2 + dy**2) ** 0.5
-                    if dist < min_distance:
-                        too_close = True
-                        break
-            if not too_close:
-                self.x = candidate_x
-                self.y = candidate_y
-                placed = True
-                break
-        if not placed:
-            self.x = random.randint(0, max_x)
-            self.y = random.randint(0, max_y)
+    def init_textures(self, placement=None):
+        # placement: PlacementService del GIFManager para no aparecer encima de otros GIFs
+        self.entry.upload()
+        self.frames = self.entry.frames
+        self.sizes = self.entry.sizes
+        self._arrays.set_frames(self._slot, self.entry)
+        if placement is not None:
+            self.x, self.y = placement.place(self.width, self.height, self.screen_width, self.screen_height)
+        else:
+            self.x = self._rng.randint(0, max(0, self.screen_width - self.width))
+            self.y = self._rng.randint(0, max(0, self.screen_height - self.height))
         self.ready = True
-        self._pil_frames = []
 
-    def update(self):
-        if not self.ready:
-            return
-        self.index = (self.index + 1) % len(self.frames)
-        self.width, self.height = self.sizes[self.index]
-        # Si está pegado a otro, sigue su movimiento
-        if self.stuck_to is not None:
-            self.x = self.stuck_to.x + self.stuck_to.width
-            self.y = self.stuck_to.y
-            return
-        self.x += self.dx
-        self.y += self.dy
-        if self.x <= 0 or self.x + self.width >= self.screen_width:
-            self.dx *= -1
-        if self.y <= 0 or self.y + self.height >= self.screen_height:
-            self.dy *= -1
-        if self.rotate_enabled:
-            self.rotate_angle = (self.rotate_angle + 5) % 360
-
-    def draw(self):
-        if not self.ready:
+    def release(self, texture_cache):
+        # Devuelve la referencia a la caché; las texturas se liberan cuando nadie más las usa
+        if self.entry is None:
             return
-        glEnable(GL_TEXTURE_2D)
-        glBindTexture(GL_TEXTURE_2D, self.frames[self.index])
-        glColor4f(1, 1, 1, 1)
-        if self.rotate_enabled:
-            cx = self.x + self.width / 2
-            cy = self.y + self.height / 2
-            glPushMatrix()
-            glTranslatef(cx, cy, 0)
-            glRotatef(self.rotate_angle, 0, 0, 1)
-            glTranslatef(-cx, -cy, 0)
-        glBegin(GL_QUADS)
-        glTexCoord2f(0, 0); glVertex2f(self.x, self.y)
-        glTexCoord2f(1, 0); glVertex2f(self.x + self.width, self.y)
-        glTexCoord2f(1, 1); glVertex2f(self.x + self.width, self.y + self.height)
-        glTexCoord2f(0, 1); glVertex2f(self.x, self.y + self.height)
-        glEnd()
-        if self.rotate_enabled:
-            glPopMatrix()
-        glDisable(GL_TEXTURE_2D)
+        texture_cache.release(self.entry)
+        self.entry = None
+        self.frames = []
+        self.sizes = []
+        # La fila vuelve al GIFManager (sus explosiones ya se soltaron en _release_gif) y el objeto pasa a la
+        # fila compartida de los eliminados
+        arrays, slot = self._arrays, self._slot
+        arrays.free(slot)
+        self._arrays, self._slot = arrays.detached(), 0
+        self.ready = False
+
+class SpatialHash:
+    # Rejilla uniforme: cada elemento se inserta en todas las celdas que cubre su AABB,
+    # así dos AABB que se solapan comparten siempre al menos una celda.
+    # Las celdas se vacían pero no se borran entre frames y la clave es un entero (no una tupla): una vez
+    # caliente, reconstruir la rejilla cada frame no crea objetos nuevos para el recolector
+    KEY_STRIDE = 1 << 20  # Filas de celdas por columna en la clave entera; sobra para cualquier pantalla
+
+    def __init__(self, cell_size=COLLISION_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self._used = []
+
+    def clear(self):
+        for cell in self._used:
+            cell.clear()
+        self._used.clear()
+
+    def _cell_range(self, x, y, width, height):
+        cs = self.cell_size
+        return int(x // cs), int((x + width) // cs), int(y // cs), int((y + height) // cs)
+
+    def insert(self, item, x, y, width, height):
+        cx0, cx1, cy0, cy1 = self._cell_range(x, y, width, height)
+        cells = self.cells
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                key = cx * self.KEY_STRIDE + cy
+                cell = cells.get(key)
+                if cell is None:
+                    cell = cells[key] = []
+                if not cell:
+                    self._used.append(cell)
+                cell.append(item)
+
+    def query(self, x, y, width, height, found=None):
+        # found: conjunto a rellenar (se vacía antes) para no crear uno por consulta
+        if found is None:
+            found = set()
+        else:
+            found.clear()
+        cx0, cx1, cy0, cy1 = self._cell_range(x, y, width, height)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = self.cells.get(cx * self.KEY_STRIDE + cy)
+                if cell:
+                    found.update(cell)
+        return found
+
+class PlacementService:
+    # Busca sitio para los GIFs nuevos a min_distance de los centros de todos los demás. Los centros se
+    # indexan en una rejilla de celdas de lado min_distance (centros ordenados por celda y un dict de celda
+    # a tramo), así cada candidato solo mira las 9 celdas vecinas. Candidatos al estilo Poisson-disk: primero uniformes y
+    # después en el anillo [r, 2r] de un sprite existente, que es donde quedan huecos con la pantalla llena
+    def __init__(self, min_distance=SPAWN_MIN_DISTANCE, max_attempts=SPAWN_ATTEMPTS, rng=None):
+        self.min_distance = min_distance
+        self.max_attempts = max_attempts
+        self.rng = rng or random
+        self._cells = {}  # clave de celda -> (inicio, fin) en _cx/_cy
+        self._cx = []
+        self._cy = []
+        self._added = defaultdict(list)  # Centros colocados desde el último rebuild
+        self._added_list = []
+
+    def _cell(self, cx, cy):
+        return int(cx // self.min_distance), int(cy // self.min_distance)
+
+    @staticmethod
+    def _cell_key(ix, iy):
+        return (ix << 32) + iy
+
+    def rebuild(self, sprites):
+        # Índice con los centros de los sprites visibles; se rehace una vez por frame con apariciones
+        n = sprites.used
+        ready = np.flatnonzero(sprites.ready[:n])
+        cx = sprites.x[ready] + sprites.width[ready] / 2
+        cy = sprites.y[ready] + sprites.height[ready] / 2
+        keys = (np.floor_divide(cx, self.min_distance).astype(np.int64) << 32) + np.floor_divide(cy, self.min_distance).astype(np.int64)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        self._cx = cx[order].tolist()
+        self._cy = cy[order].tolist()
+        cell_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+        self._cells = dict(zip(cell_keys.tolist(), zip(starts.tolist(), (starts + counts).tolist())))
+        self._added.clear()
+        self._added_list = []
+
+    def is_free(self, cx, cy):
+        min_dist2 = self.min_distance * self.min_distance
+        ix, iy = self._cell(cx, cy)
+        for nx in (ix - 1, ix, ix + 1):
+            for ny in (iy - 1, iy, iy + 1):
+                key = self._cell_key(nx, ny)
+                lo, hi = self._cells.get(key, (0, 0))
+                for k in range(lo, hi):
+                    if (self._cx[k] - cx) ** 2 + (self._cy[k] - cy) ** 2 < min_dist2:
+                        return False
+                for ox, oy in self._added.get(key, ()):
+                    if (ox - cx) ** 2 + (oy - cy) ** 2 < min_dist2:
+                        return False
+        return True
+
+    def _candidate(self, attempt, width, height, max_x, max_y):
+        n = len(self._cx) + len(self._added_list)
+        if attempt < SPAWN_UNIFORM_ATTEMPTS or n == 0:
+            return self.rng.randint(0, max_x), self.rng.randint(0, max_y)
+        k = self.rng.randrange(n)
+        ox, oy = (self._cx[k], self._cy[k]) if k < len(self._cx) else self._added_list[k - len(self._cx)]
+        angle = self.rng.uniform(0, 2 * math.pi)
+        radius = self.rng.uniform(self.min_distance, 2 * self.min_distance)
+        x = int(round(ox + radius * math.cos(angle) - width / 2))
+        y = int(round(oy + radius * math.sin(angle) - height / 2))
+        return min(max(x, 0), max_x), min(max(y, 0), max_y)
+
+    def place(self, width, height, screen_width, screen_height):
+        # Esquina superior izquierda libre (o aleatoria si no hay hueco) y la registra en el índice
+        max_x = max(0, screen_width - width)
+        max_y = max(0, screen_height - height)
+        for attempt in range(self.max_attempts):
+            x, y = self._candidate(attempt, width, height, max_x, max_y)
+            if self.is_free(x + width / 2, y + height / 2):
+                break
+        else:
+            x, y = self.rng.randint(0, max_x), self.rng.randint(0, max_y)
+        center = (x + width / 2, y + height / 2)
+        self._added[self._cell_key(*self._cell(*center))].append(center)
+        self._added_list.append(center)
+        return x, y
+
+class TextureUploader:
+    # Reparte la subida de texturas entre frames: cada frame sube filas de las entradas en cola hasta
+    # agotar el presupuesto de bytes o de tiempo, pasando por un anillo de PBOs. Solo en el hilo GL
+    def __init__(self, budget_bytes=UPLOAD_BUDGET_BYTES, budget_time=UPLOAD_BUDGET_TIME, pbo_count=UPLOAD_PBO_COUNT):
+        self.budget_bytes = budget_bytes
+        self.budget_time = budget_time
+        self.pbo_count = pbo_count
+        self.queue = deque()
+        self.bytes_uploaded = 0
+        self._pbos = None
+        self._pbo_index = 0
+
+    def request(self, entry):
+        if entry not in self.queue:
+            self.queue.append(entry)
+
+    def _next_pbo(self):
+        if self._pbos is None:
+            try:
+                pbos = glGenBuffers(self.pbo_count)
+                self._pbos = [int(pbo) for pbo in np.atleast_1d(pbos)]
+            except Exception:
+                self._pbos = []  # Sin PBOs (GL < 2.1): glTexSubImage2D directo desde memoria
+        if not self._pbos:
+            return None
+        self._pbo_index = (self._pbo_index + 1) % len(self._pbos)
+        return self._pbos[self._pbo_index]
+
+    def pump(self):
+        start = time.perf_counter()
+        sent = 0
+        while self.queue and sent < self.budget_bytes and time.perf_counter() - start < self.budget_time:
+            entry = self.queue[0]
+            if entry.uploaded or not entry.decoded:
+                # Terminada por otra vía (subida síncrona) o expulsada de la caché a medias
+                self.queue.popleft()
+                continue
+            sent += entry.upload_step(self.budget_bytes - sent, self._next_pbo())
+            if entry.uploaded:
+                self.queue.popleft()
+        self.bytes_uploaded += sent
+        return sent
+
+    def release(self):
+        self.queue.clear()
+        if self._pbos:
+            glDeleteBuffers(len(self._pbos), self._pbos)
+        self._pbos = None
+
 
 class GIFManager:
-    def __init__(self):
+    def __init__(self, asset_pack=None, profiler=None, quality=None, seed=None, gpu_motion=False):
+        # seed: semilla del generador de posiciones y velocidades; con la misma semilla y las mismas
+        # órdenes en los mismos pasos (y synchronous_loads) la sesión se repite exactamente.
+        # gpu_motion: los GIFs sin stick_on_collision se mueven y dibujan en el GPUSpriteLayer
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.synchronous_loads = False
         self.active_gifs = defaultdict(list)
         self.explosions = []
+        # Capas de efectos para el dibujo, al día en cada alta y baja: los pegados a una cabeza (por fila
+        # del sprite, se dibujan justo encima de ella) y los libres (encima de todos los sprites)
+        self.head_effects = defaultdict(list)
+        self.free_effects = []
+        # Objetos liberados listos para reutilizar, así el bucle de frames no crea ni destruye objetos
+        self._gif_pool = []
+        self._effect_pool = []
+        self.effect_entry = None  # Textura de las explosiones, cargada una vez con preload_effects
+        self.texture_cache = TextureCache(asset_pack=asset_pack)
+        self.collision_grid = SpatialHash()
+        self.sprites = SpriteArrays()
+        self.uploader = TextureUploader()
+        self.placement = PlacementService(rng=self.rng)
+        self.profiler = profiler or FrameProfiler()
+        self.quality = quality or QualityGovernor()
+        self.ticks = 0  # Pasos de simulación ejecutados
+        # Relojes de la simulación para el GPUSpriteLayer: clock avanza en cada paso, anim_clock se queda en el
+        # último paso con animación y spin_clock solo avanza con la rotación activada
+        self.clock = 0.0
+        self.anim_clock = 0.0
+        self.spin_clock = 0.0
+        self.gpu_layer = GPUSpriteLayer() if gpu_motion else None
+        # GIFs pedidos cuyo asset aún se está decodificando, por tecla (se cancelan con remove_gifs)
+        self.loading = defaultdict(list)
+        self._loading_lock = threading.Lock()
+        self._failed_gifs = []  # GIFs cuyo asset no se pudo decodificar, pendientes de liberar
+        # Lista plana de GIFs en el mismo orden que active_gifs; se reconstruye solo cuando cambia
+        self._all_gifs = []
+        self._all_slots = np.zeros(0, dtype=np.int64)
+        self._sticky = []  # Posiciones en _all_gifs de los que tienen stick_on_collision
+        self._all_gifs_version = 0
+        self._gifs_version = 0
+        self._gif_by_slot = {}
+        self._neighbours = set()
     pending_gifs = []
-    @staticmethod
-    def load_texture_from_pil(img):
-        img_data = img.tobytes()
-        width, height = img.size
-        tex_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, tex_id)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
-        return tex_id, width, height
+
+    def preload_effects(self):
+        # Al arrancar (con contexto GL): que la primera explosión no tenga que leer la imagen en mitad de update
+        if self.effect_entry is None:
+            self.effect_entry = self.texture_cache.acquire(EXPLOSION_IMAGE, synchronous=True)
+            if not self.effect_entry.frames:
+                print(f"Error cargando imagen de explosión: {EXPLOSION_IMAGE}")
+
+    def prefetch(self, gif_mapping):
+        # Assets de las teclas al tamaño del nivel de calidad actual, con prioridad baja: al arrancar y
+        # cuando el QualityGovernor cambia de nivel (los GIFs nuevos salen a otro tamaño)
+        scale = self.quality.level['spawn_scale']
+        for info in gif_mapping.values():
+            if os.path.exists(info['path']):
+                self.texture_cache.prefetch(info['path'], scaled_size(info.get('max_width'), scale),
+                                            scaled_size(info.get('max_height'), scale))
+
+    def _new_gif(self, entry, screen_width, screen_height, on_ready, stick_on_collision, colision_tipo):
+        if self._gif_pool:
+            gif = self._gif_pool.pop()
+            gif.reset(entry, self.sprites, screen_width, screen_height, on_ready, stick_on_collision, colision_tipo, self.rng)
+            return gif
+        return BouncingGIF(entry, self.sprites, screen_width, screen_height, on_ready=on_ready,
+                           stick_on_collision=stick_on_collision, colision_tipo=colision_tipo, rng=self.rng)
+
+    def _new_explosion(self, head):
+        # Explosión centrada sobre la cabeza, reutilizando una del pool si hay
+        self.preload_effects()
+        if self._effect_pool:
+            explosion = self._effect_pool.pop()
+        else:
+            explosion = ExplosionEffect(self.effect_entry)
+        explosion.reset(head)
+        return explosion
 
     def add_gif(self, key, gif_path, screen_width, screen_height, rotate_on_ready=False, stick_on_collision=False, max_width=None, max_height=None, colision_tipo=None):
         def on_ready(gif_obj):
-            GIFManager.pending_gifs.append(gif_obj)
-            self.active_gifs[key].append(gif_obj)
+            with self._loading_lock:
+                # Si ya no está en loading es que se canceló con Shift+tecla mientras se decodificaba
+                if gif_obj not in self.loading[key]:
+                    return
+                self.loading[key].remove(gif_obj)
+                if gif_obj.entry.failed:
+                    # No se pudo decodificar: process_pending (hilo GL) lo libera sin que llegue a aparecer
+                    self._failed_gifs.append(gif_obj)
+                    return
+                GIFManager.pending_gifs.append(gif_obj)
+                self.active_gifs[key].append(gif_obj)
+                self._gifs_version += 1
             # Si es piolet, ya rota siempre. Si no, solo rota si se pide (Ctrl)
             if rotate_on_ready and getattr(gif_obj, 'colision_tipo', None) != 'piolet':
                 gif_obj.rotate_enabled = True
-        BouncingGIF(gif_path, screen_width, screen_height, on_ready=on_ready, stick_on_collision=stick_on_collision, max_width=max_width, max_height=max_height, colision_tipo=colision_tipo)
+        scale = self.quality.level['spawn_scale']
+        max_width, max_height = scaled_size(max_width, scale), scaled_size(max_height, scale)
+        # Cargas síncronas al reproducir una sesión: el GIF aparece en el mismo paso en todas las ejecuciones
+        entry = self.texture_cache.acquire(gif_path, max_width, max_height, synchronous=self.synchronous_loads)
+        gif = self._new_gif(entry, screen_width, screen_height, on_ready, stick_on_collision, colision_tipo)
+        with self._loading_lock:
+            self.loading[key].append(gif)
+        # La entrada de la caché avisa cuando los frames están decodificados (al instante si ya lo estaban)
+        entry.add_waiter(gif._entry_decoded)
 
     def remove_gifs(self, key):
+        # También cancela los que aún se están decodificando, para que no aparezcan después
+        with self._loading_lock:
+            cancelled, self.loading[key] = self.loading[key], []
+        for gif in cancelled:
+            gif.release(self.texture_cache)
+            self._gif_pool.append(gif)
+        for gif in self.active_gifs[key]:
+            self._release_gif(gif)
         self.active_gifs[key].clear()
+        self._gifs_version += 1
 
-    def update(self):
-        # Actualizar todos los GIFs
-        all_gifs = [gif for gif_list in self.active_gifs.values() for gif in gif_list]
-        # Colisiones solo entre los que tienen stick_on_collision
-        for i, gif1 in enumerate(all_gifs):
-            if not gif1.stick_on_collision or gif1.stuck_to is not None:
+    def _release_gif(self, gif):
+        if gif in GIFManager.pending_gifs:
+            GIFManager.pending_gifs.remove(gif)
+        # Sus efectos siguen hasta acabar donde estaban, pero ya sin cabeza debajo: pasan a la capa libre
+        for explosion in self.head_effects.pop(gif._slot, ()):
+            explosion.cabeza_gif = None
+            self.free_effects.append(explosion)
+        if self.gpu_layer is not None:
+            self.gpu_layer.remove(gif._slot, self.sprites)
+        gif.release(self.texture_cache)
+        self._gif_pool.append(gif)
+
+    def add_explosion(self, explosion):
+        self.explosions.append(explosion)
+        if explosion.cabeza_gif is not None:
+            self.head_effects[explosion.cabeza_gif._slot].append(explosion)
+        else:
+            self.free_effects.append(explosion)
+
+    def _drop_explosion(self, explosion):
+        if explosion.cabeza_gif is not None:
+            slot = explosion.cabeza_gif._slot
+            effects = self.head_effects[slot]
+            effects.remove(explosion)
+            if not effects:
+                del self.head_effects[slot]
+        else:
+            self.free_effects.remove(explosion)
+        explosion.release()
+        self._effect_pool.append(explosion)
+
+    def clear_explosions(self):
+        for explosion in self.explosions:
+            explosion.release()
+        self._effect_pool.extend(self.explosions)
+        self.explosions = []
+        self.head_effects.clear()
+        self.free_effects = []
+
+    def cull_oldest(self, max_per_key):
+        # Deja como mucho max_per_key GIFs por tecla eliminando los más antiguos (los primeros de la lista)
+        for gifs in self.active_gifs.values():
+            excess = len(gifs) - max_per_key
+            if excess > 0:
+                for gif in gifs[:excess]:
+                    self._release_gif(gif)
+                del gifs[:excess]
+                self._gifs_version += 1
+
+    def _release_failed(self):
+        with self._loading_lock:
+            failed, self._failed_gifs = self._failed_gifs, []
+        for gif in failed:
+            gif.release(self.texture_cache)
+            self._gif_pool.append(gif)
+
+    def release_all(self):
+        # Al salir: liberar sprites, explosiones y todas las texturas de la caché
+        self._release_failed()
+        for key in set(self.active_gifs) | set(self.loading):
+            self.remove_gifs(key)
+        self.clear_explosions()
+        if self.effect_entry is not None:
+            self.texture_cache.release(self.effect_entry)
+            self.effect_entry = None
+        self.texture_cache.decode_pool.shutdown()
+        self.uploader.release()
+        if self.gpu_layer is not None:
+            self.gpu_layer.release()
+        self.texture_cache.clear()
+
+    def all_gifs(self):
+        # La versión se lee antes de construir: si el hilo de carga añade un GIF a la vez, se reconstruye en el siguiente frame
+        version = self._gifs_version
+        if version != self._all_gifs_version:
+            self._all_gifs = [gif for gif_list in self.active_gifs.values() for gif in gif_list]
+            self._all_slots = np.array([gif._slot for gif in self._all_gifs], dtype=np.int64)
+            self._gif_by_slot = {gif._slot: gif for gif in self._all_gifs}
+            self._sticky = [i for i, gif in enumerate(self._all_gifs) if gif.stick_on_collision]
+            self._all_gifs_version = version
+        return self._all_gifs
+
+    def handle_collisions(self, all_gifs):
+        # Colisiones entre grupos de pegados, no entre sprites: cada grupo libre con stick_on_collision entra
+        # en el hash espacial con la caja que envuelve a sus miembros. Los grupos se recorren en el orden de su
+        # raíz en active_gifs (i < j) y, si las cajas se tocan, el primer par de miembros que se solapa decide:
+        # el grupo j se pega al i por ese par. Sin pegados es exactamente el recorrido por pares de antes
+        # Se leen los arrays una vez como listas: mucho más rápido que pasar por las propiedades de cada vista.
+        # Las cajas van en listas de floats y la rejilla reutiliza sus celdas, para no llenar el recolector
+        # de tuplas y listas que viven todo el frame. Solo se recorren los que tienen stick_on_collision
+        sticky = self._sticky if all_gifs is self._all_gifs else [i for i, gif in enumerate(all_gifs) if gif.stick_on_collision]
+        if not sticky:
+            return
+        sprites = self.sprites
+        grid = self.collision_grid
+        grid.clear()
+        xs = sprites.x.tolist()
+        ys = sprites.y.tolist()
+        ws = sprites.width.tolist()
+        hs = sprites.height.tolist()
+        stuck = sprites.stuck_to.tolist()
+        group = sprites.group.tolist()
+        ready = sprites.ready.tolist()
+        slots = self._all_slots.tolist() if all_gifs is self._all_gifs else [gif._slot for gif in all_gifs]
+        gif_by_slot = self._gif_by_slot if all_gifs is self._all_gifs else {gif._slot: gif for gif in all_gifs}
+        count = len(all_gifs)
+        box_x0 = [0.0] * count
+        box_y0 = [0.0] * count
+        box_x1 = [0.0] * count
+        box_y1 = [0.0] * count
+        # Miembros al empezar el frame de los grupos de más de uno (los sueltos se comparan solo consigo)
+        group_members = {}
+        candidates = []
+        for i in sticky:
+            s = slots[i]
+            # Sin ready aún se está subiendo: está en (0, 0) con tamaño 1x1 y no puede pegarse ni explotar
+            if group[s] != s or stuck[s] != -1 or not ready[s]:
+                continue
+            members = sprites.members.get(s)
+            if members is None:
+                x0, y0, x1, y1 = xs[s], ys[s], xs[s] + ws[s], ys[s] + hs[s]
+            else:
+                group_members[i] = list(members)
+                x0 = min(xs[m] for m in members)
+                y0 = min(ys[m] for m in members)
+                x1 = max(xs[m] + ws[m] for m in members)
+                y1 = max(ys[m] + hs[m] for m in members)
+            box_x0[i], box_y0[i], box_x1[i], box_y1[i] = x0, y0, x1, y1
+            grid.insert(i, x0, y0, x1 - x0, y1 - y0)
+            candidates.append(i)
+        merged = set()
+        found = self._neighbours
+        for i in candidates:
+            if i in merged:
+                continue
+            x0, y0, x1, y1 = box_x0[i], box_y0[i], box_x1[i], box_y1[i]
+            grid.query(x0, y0, x1 - x0, y1 - y0, found)
+            if len(found) < 2:
                 continue
-            for gif2 in all_gifs[i+1:]:
-                if not gif2.stick_on_collision or gif2.stuck_to is not None:
+            for j in sorted(found):
+                if j <= i or j in merged:
                     continue
+                if not (x0 < box_x1[j] and x1 > box_x0[j] and y0 < box_y1[j] and y1 > box_y0[j]):
+                    continue
+                pair = self._first_overlap(group_members.get(i) or (slots[i],), group_members.get(j) or (slots[j],),
+                                           xs, ys, ws, hs)
+                if pair is None:
+                    continue
+                gif1 = gif_by_slot[pair[0]]
+                gif2 = gif_by_slot[pair[1]]
+                tipo1 = getattr(gif1, 'colision_tipo', None)
+                tipo2 = getattr(gif2, 'colision_tipo', None)
+                # Sangre sobre cabeza solo si colisiona con piolet
+                if not self.quality.level['explosions']:
+                    pass
+                elif (tipo1 == 'cabeza' and tipo2 == 'piolet'):
+                    self.add_explosion(self._new_explosion(gif1))
+                elif (tipo2 == 'cabeza' and tipo1 == 'piolet'):
+                    self.add_explosion(self._new_explosion(gif2))
+                # Al colisionar, se pegan: el grupo de gif2 se pega a gif1
+                gif2.stuck_to = gif1
+                merged.add(j)
+
+    @staticmethod
+    def _first_overlap(members1, members2, xs, ys, ws, hs):
+        for s1 in members1:
+            x1, y1, w1, h1 = xs[s1], ys[s1], ws[s1], hs[s1]
+            for s2 in members2:
                 # Chequeo de colisión AABB
-                if (gif1.x < gif2.x + gif2.width and gif1.x + gif1.width > gif2.x and
-                    gif1.y < gif2.y + gif2.height and gif1.y + gif1.height > gif2.y):
-                    tipo1 = getattr(gif1, 'colision_tipo', None)
-                    tipo2 = getattr(gif2, 'colision_tipo', None)
-                    # Sangre sobre cabeza solo si colisiona con piolet
-                    if (tipo1 == 'cabeza' and tipo2 == 'piolet'):
-                        ex = int(gif1.x + gif1.width // 2 - 32)  # 32 = blood.png ancho/2
-                        ey = int(gif1.y + gif1.height // 2 - 32)
-                        self.explosions.append(ExplosionEffect(ex, ey, cabeza_gif=gif1))
-                    elif (tipo2 == 'cabeza' and tipo1 == 'piolet'):
-                        ex = int(gif2.x + gif2.width // 2 - 32)
-                        ey = int(gif2.y + gif2.height // 2 - 32)
-                        self.explosions.append(ExplosionEffect(ex, ey, cabeza_gif=gif2))
-                    # Al colisionar, se pegan: gif2 se pega a gif1
-                    gif2.stuck_to = gif1
-                    gif2.dx = gif1.dx
-                    gif2.dy = gif1.dy
-        # Actualizar todos los GIFs
-        for gif in all_gifs:
-            gif.update()
+                if (x1 < xs[s2] + ws[s2] and x1 + w1 > xs[s2] and
+                    y1 < ys[s2] + hs[s2] and y1 + h1 > ys[s2]):
+                    return s1, s2
+        return None
+
+    def update(self, dt):
+        # dt: segundos de simulación a avanzar
+        profiler = self.profiler
+        level = self.quality.level
+        if level['max_per_key'] is not None:
+            self.cull_oldest(level['max_per_key'])
+        if not level['explosions'] and self.explosions:
+            self.clear_explosions()
+        t = profiler.start()
+        all_gifs = self.all_gifs()
+        self.handle_collisions(all_gifs)
+        profiler.stop('colisiones', t)
+        t = profiler.start()
+        # Actualizar todos los GIFs de una vez sobre los arrays
+        self.ticks += 1
+        self.clock += dt
+        animate = self.ticks % level['anim_divisor'] == 0
+        if animate:
+            self.anim_clock = self.clock
+        if level['rotation']:
+            self.spin_clock += dt
+        self.sprites.step(self._all_slots, dt, animate=animate, rotate=level['rotation'])
+        profiler.stop('movimiento', t)
+        t = profiler.start()
+        self.update_explosions(dt)
+        profiler.stop('explosiones', t)
+
+    def update_explosions(self, dt):
         # Actualizar explosiones y eliminar las inactivas
-        for explosion in self.explosions[:]:
-            explosion.update()
-            if not explosion.active:
-                self.explosions.remove(explosion)
-
-    def draw(self):
-        # Dibujar GIFs y, si corresponde, la sangre justo después de la cabeza afectada
-        drawn_explosions = set()
-        for gif_list in self.active_gifs.values():
-            for gif in gif_list:
-                gif.draw()
-                # Si es cabeza, buscar explosiones que estén centradas sobre ella y dibujarlas justo después
-                if getattr(gif, 'colision_tipo', None) == 'cabeza':
-                    for i, explosion in enumerate(self.explosions):
-                        # Comprobar si la explosión está centrada sobre esta cabeza y no se ha dibujado aún
-                        cx = int(gif.x + gif.width // 2 - explosion.width // 2)
-                        cy = int(gif.y + gif.height // 2 - explosion.height // 2)
-                        if (abs(explosion.x - cx) <= 2 and abs(explosion.y - cy) <= 2 and id(explosion) not in drawn_explosions):
-                            explosion.draw()
-                            drawn_explosions.add(id(explosion))
-        # Dibujar el resto de explosiones (por si hay alguna no asociada a cabeza)
+        finished = False
         for explosion in self.explosions:
-            if id(explosion) not in drawn_explosions:
-                explosion.draw()
+            explosion.update(dt)
+            if not explosion.active:
+                self._drop_explosion(explosion)
+                finished = True
+        if finished:
+            self.explosions = [e for e in self.explosions if e.active]
+
+    def draw(self, batch):
+        # Capas (el fondo ya lo dibujó BackgroundManager): todos los GIFs listos en el orden de active_gifs,
+        # cada efecto pegado justo después de su cabeza para que quede encima de ella, y los efectos libres
+        # al final. Se dibuja todo en un único lote, encima de los sprites del GPUSpriteLayer
+        self.all_gifs()
+        sprites = self.sprites
+        if self.gpu_layer is not None:
+            self.gpu_layer.draw(sprites, self.clock, self.anim_clock, self.spin_clock, self.quality.level['rotation'])
+        order = self._all_slots
+        rows = order[sprites.ready[order] & ~sprites.gpu[order]]
+        frame = sprites.frame_base[rows] + sprites.index[rows]
+        tex = sprites.frame_tex[frame]
+        uv = sprites.frame_uv[frame]
+        crop = sprites.frame_crop[frame]
+        x = sprites.x[rows]
+        y = sprites.y[rows]
+        w = sprites.width[rows]
+        h = sprites.height[rows]
+        if self.quality.level['rotation']:
+            angle = np.where(sprites.rotate_enabled[rows], sprites.rotate_angle[rows], 0.0)
+        else:
+            angle = None  # Sin rotación: quads alineados a los ejes, más baratos de generar
+        if self.explosions:
+            # Posición de dibujo de cada fila lista, para colocar los efectos de cada cabeza en O(n)
+            position = np.full(sprites.capacity, -1, dtype=np.int64)
+            position[rows] = np.arange(len(rows))
+            at = []
+            chosen = []
+            for slot, effects in self.head_effects.items():
+                # Si la cabeza aún no se dibuja, sus efectos van con los libres
+                head = int(position[slot]) + 1 if position[slot] >= 0 else len(rows)
+                for explosion in effects:
+                    if explosion.active and explosion.texture_id is not None:
+                        at.append(head)
+                        chosen.append(explosion)
+            for explosion in self.free_effects:
+                if explosion.active and explosion.texture_id is not None:
+                    at.append(len(rows))
+                    chosen.append(explosion)
+            # np.insert respeta el orden de llegada en un mismo índice: varios efectos de una cabeza se apilan
+            tex = np.insert(tex, at, [e.texture_id for e in chosen])
+            x = np.insert(x, at, [e.x for e in chosen])
+            y = np.insert(y, at, [e.y for e in chosen])
+            w = np.insert(w, at, [e.width for e in chosen])
+            h = np.insert(h, at, [e.height for e in chosen])
+            if angle is not None:
+                angle = np.insert(angle, at, 0.0)
+            uv = np.insert(uv, at, np.array([e.uv for e in chosen], dtype=np.float32).reshape(-1, 4), axis=0)
+            crop = np.insert(crop, at, np.array([e.crop for e in chosen], dtype=np.float32).reshape(-1, 4), axis=0)
+        batch.draw(tex, x, y, w, h, angle, uv, crop)
 
     def process_pending(self):
+        # Los frames se suben poco a poco con el presupuesto del uploader; el sprite aparece cuando
+        # todas sus páginas están en la GPU, así que la llegada de un GIF grande no da tirones
+        if self._failed_gifs:
+            self._release_failed()
+        for gif in GIFManager.pending_gifs:
+            if gif.entry.decoded and not gif.entry.uploaded:
+                self.uploader.request(gif.entry)
+        self.uploader.pump()
+        placement_ready = False
+        gpu_layer = self.gpu_layer
         for gif in GIFManager.pending_gifs[:]:
-            if gif._pil_frames:
-                gif.init_textures()
+            if gif.entry.uploaded:
+                if not placement_ready:
+                    if gpu_layer is not None:
+                        gpu_layer.sync(self.sprites, self.clock, self.spin_clock)
+                    self.placement.rebuild(self.sprites)
+                    placement_ready = True
+                gif.init_textures(self.placement)
                 GIFManager.pending_gifs.remove(gif)
+                # Los que nunca se pegan pasan a la GPU si su asset cabe en una textura
+                if (gpu_layer is not None and not gif.stick_on_collision and gpu_layer.accepts(gif.entry)
+                        and gpu_layer.available()):
+                    gpu_layer.add(gif._slot, self.sprites, self.clock, self.spin_clock)
+
+def capture_writer(shm_name, width, height, slots, jobs, done, output, fmt, command):
+    # Proceso escritor: recibe (hueco, número de frame) por jobs, escribe el frame que hay en ese hueco de la
+    # memoria compartida y devuelve el hueco por done. None termina. Si falla (sin codificador, disco lleno...)
+    # manda el error como texto por done y termina
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((slots, height, width, 4), dtype=np.uint8, buffer=shm.buf)
+    encoder = None
+    try:
+        if fmt == 'pipe':
+            args = [arg.format(width=width, height=height, fps=FPS, output=output) for arg in command]
+            encoder = subprocess.Popen(args, stdin=subprocess.PIPE)
+        else:
+            os.makedirs(output, exist_ok=True)
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            slot, number = job
+            frame = frames[slot][::-1]  # glReadPixels empieza por la fila de abajo
+            if fmt == 'raw':
+                with open(os.path.join(output, f'frame_{number:06d}.rgba'), 'wb') as f:
+                    f.write(frame.tobytes())
+            elif fmt == 'png':
+                Image.fromarray(frame, 'RGBA').save(os.path.join(output, f'frame_{number:06d}.png'), compress_level=1)
+            else:
+                encoder.stdin.write(frame.tobytes())
+            done.put(slot)
+    except Exception as e:
+        done.put(f"{type(e).__name__}: {e}")
+    finally:
+        if encoder is not None:
+            try:
+                encoder.stdin.close()
+            except OSError:
+                pass
+            encoder.wait()
+        del frames
+        shm.close()
+
+class FrameCapture:
+    # Grabación sin parar el render: glReadPixels va a un anillo de PBOs (la copia la hace la GPU de forma
+    # asíncrona) y el frame se mapea pbo_count - 1 frames después, cuando ya está listo. De ahí se copia a
+    # un hueco de memoria compartida y el proceso escritor lo guarda o lo pasa al codificador.
+    # Lee del back buffer o de cualquier framebuffer (source_fbo), así que sirve también sin ventana
+    def __init__(self, width, height, output=None, fmt=CAPTURE_FORMAT, scale=CAPTURE_SCALE, pbo_count=CAPTURE_PBO_COUNT,
+                 slots=CAPTURE_SLOTS, command=CAPTURE_PIPE_COMMAND):
+        self.source_width = width
+        self.source_height = height
+        self.width = max(1, width // scale)
+        self.height = max(1, height // scale)
+        self.frame_bytes = self.width * self.height * 4
+        output = output or (CAPTURE_VIDEO if fmt == 'pipe' else CAPTURE_DIR)
+        self.output = output.format(stamp=time.strftime('%Y%m%d-%H%M%S'))
+        self.fmt = fmt
+        self.pbo_count = pbo_count
+        self.slots = slots
+        self.command = command
+        self.frames = 0  # Frames leídos a PBO
+        self.written = 0  # Frames enviados al escritor
+        self.dropped = 0  # Frames descartados porque el escritor no daba abasto
+        self.error = None  # Motivo si el proceso escritor falló: la grabación deja de leer frames
+        self.capture_times = deque(maxlen=PROFILER_HISTORY)  # Coste de capture() en el hilo de render
+        self._pbos = None
+        self._fbo = None
+        self._renderbuffer = None
+        self._shm = None
+        self._buffer = None
+        self._free = []
+        self._process = None
+
+    def start(self):
+        self._pbos = [int(pbo) for pbo in np.atleast_1d(glGenBuffers(self.pbo_count))]
+        for pbo in self._pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.frame_bytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        if (self.width, self.height) != (self.source_width, self.source_height):
+            # Framebuffer pequeño para reducir con glBlitFramebuffer: se lee (y se copia) solo lo que se graba
+            self._renderbuffer = glGenRenderbuffers(1)
+            glBindRenderbuffer(GL_RENDERBUFFER, self._renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, self.width, self.height)
+            glBindRenderbuffer(GL_RENDERBUFFER, 0)
+            previous_read = glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING)
+            previous_draw = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+            self._fbo = glGenFramebuffers(1)
+            glBindFramebuffer(GL_FRAMEBUFFER, self._fbo)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self._renderbuffer)
+            glBindFramebuffer(GL_READ_FRAMEBUFFER, previous_read)
+            glBindFramebuffer(GL_DRAW_FRAMEBUFFER, previous_draw)
+        self._shm = shared_memory.SharedMemory(create=True, size=self.frame_bytes * self.slots)
+        self._buffer = np.ndarray((self.slots, self.frame_bytes), dtype=np.uint8, buffer=self._shm.buf)
+        self._free = list(range(self.slots))
+        self._jobs = multiprocessing.Queue()
+        self._done = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=capture_writer, name='captura', daemon=True,
+            args=(self._shm.name, self.width, self.height, self.slots, self._jobs, self._done, self.output, self.fmt,
+                  self.command))
+        self._process.start()
+
+    def failed(self):
+        # True si el escritor ha muerto o ha mandado un error; entonces ya no se lee ni se espera nada de él
+        if self.error is None:
+            self._receive_done()
+        if self.error is None and not self._process.is_alive():
+            self.error = f"el proceso escritor terminó con código {self._process.exitcode}"
+        return self.error is not None
+
+    def _receive_done(self):
+        # Huecos que el escritor ya ha terminado (o su error)
+        while True:
+            try:
+                item = self._done.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, str):
+                self.error = item
+            else:
+                self._free.append(item)
+
+    def capture(self, source_fbo=0):
+        # Llamar con el frame ya dibujado (antes del swap si es el back buffer de la ventana).
+        # Deja enlazados los framebuffers de lectura y dibujo que tenía el llamador
+        if self.failed():
+            return
+        start = time.perf_counter()
+        previous_read = glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING)
+        previous_draw = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        read_fbo = source_fbo
+        if self._fbo is not None:
+            glBindFramebuffer(GL_READ_FRAMEBUFFER, source_fbo)
+            glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self._fbo)
+            glBlitFramebuffer(0, 0, self.source_width, self.source_height, 0, 0, self.width, self.height,
+                              GL_COLOR_BUFFER_BIT, GL_LINEAR)
+            glBindFramebuffer(GL_DRAW_FRAMEBUFFER, previous_draw)
+            read_fbo = self._fbo
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, read_fbo)
+        if read_fbo == 0:
+            glReadBuffer(GL_BACK)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self._pbos[self.frames % self.pbo_count])
+        glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        self.frames += 1
+        # El PBO que toca sobrescribir en el siguiente frame es el más antiguo: ya ha tenido
+        # pbo_count - 1 frames para completarse, así que mapearlo no espera a la GPU
+        if self.frames >= self.pbo_count:
+            self._collect(self.frames - self.pbo_count)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, previous_read)
+        self.capture_times.append(time.perf_counter() - start)
+
+    def _collect(self, number, wait=False):
+        # Copia el frame `number` de su PBO a un hueco libre y se lo pasa al escritor
+        # Al parar se espera a un hueco en vez de descartar, mientras el escritor siga vivo
+        self._receive_done()
+        while wait and not self._free and not self.failed():
+            try:
+                item = self._done.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if isinstance(item, str):
+                self.error = item
+            else:
+                self._free.append(item)
+        if self.error is not None:
+            self.dropped += 1
+            return
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self._pbos[number % self.pbo_count])
+        if not self._free:
+            self.dropped += 1
+            return
+        pointer = glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY)
+        if not pointer:
+            self.dropped += 1
+            return
+        slot = self._free.pop()
+        ctypes.memmove(self._buffer[slot].ctypes.data, pointer, self.frame_bytes)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        self._jobs.put((slot, number))
+        self.written += 1
+
+    def stop(self):
+        # Recoge los frames que quedan en el anillo (esperando hueco si hace falta) y cierra el escritor
+        if self._process is None:
+            return
+        for number in range(max(0, self.frames - self.pbo_count + 1), self.frames):
+            self._collect(number, wait=True)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self._jobs.put(None)
+        self._process.join(CAPTURE_WRITER_TIMEOUT)
+        if self._process.is_alive():
+            self.error = self.error or "el proceso escritor no terminó a tiempo"
+            self._process.terminate()
+            self._process.join()
+        self._receive_done()
+        # Sin esperar a que la cola de órdenes vacíe su hilo: el escritor puede no haberla leído
+        self._jobs.cancel_join_thread()
+        self._process = None
+        self._buffer = None
+        self._shm.close()
+        self._shm.unlink()
+        glDeleteBuffers(len(self._pbos), self._pbos)
+        if self._fbo is not None:
+            glDeleteFramebuffers(1, [self._fbo])
+            glDeleteRenderbuffers(1, [self._renderbuffer])
+            self._fbo = self._renderbuffer = None
+
+    def report(self):
+        cost = np.array(self.capture_times) * 1000 if self.capture_times else np.zeros(1)
+        error = f" | error del escritor: {self.error}" if self.error else ""
+        return (f"Grabación {self.width}x{self.height} ({self.fmt}) en {self.output}: {self.written} frames, "
+                f"{self.dropped} descartados | coste p50 {np.percentile(cost, 50):.2f} ms, máx {cost.max():.2f} ms{error}")
+
+def enable_vsync():
+    # Intervalo de intercambio 1 con la extensión que haya en la plataforma; False si no hay ninguna
+    attempts = [
+        ('OpenGL.WGL.EXT.swap_control', 'wglSwapIntervalEXT'),
+        ('OpenGL.GLX.SGI.swap_control', 'glXSwapIntervalSGI'),
+        ('OpenGL.GLX.MESA.swap_control', 'glXSwapIntervalMESA'),
+    ]
+    for module_name, function_name in attempts:
+        try:
+            module = __import__(module_name, fromlist=[function_name])
+            getattr(module, function_name)(1)
+            return True
+        except Exception:
+            continue
+    return False
+
+class FrameScheduler:
+    # Paso de simulación fijo con acumulador: cada frame se ejecutan tantos pasos de sim_dt como
+    # tiempo real haya pasado (como mucho max_steps), y se espera lo que quede de presupuesto del frame
+    # durmiendo y, al final, en bucle activo. En modo vsync no se espera: bloquea glutSwapBuffers
+    def __init__(self, fps=FPS, sim_hz=SIM_HZ, max_steps=MAX_CATCHUP_STEPS, vsync=VSYNC, stats_window=600):
+        self.frame_budget = 1 / fps
+        self.sim_dt = 1 / sim_hz
+        self.max_steps = max_steps
+        self.vsync = vsync
+        self.accumulator = 0.0
+        self.dropped_time = 0.0
+        self._last_tick = None
+        self._deadline = None
+        self.frame_times = deque(maxlen=stats_window)
+        self.missed_deadlines = 0
+        self.frames = 0
+
+    def wait_for_frame(self, wake=None):
+        # Duerme hasta el siguiente plazo; si ya ha pasado es un frame perdido y se reengancha desde ahora.
+        # wake: Event que adelanta el frame (llegan órdenes de red). Los plazos no se mueven: el frame adelantado
+        # ocupa el de su plazo, así que como mucho hay uno por plazo y un chorro de datagramas no sube de FPS
+        if self.vsync:
+            return
+        now = time.perf_counter()
+        if self._deadline is None:
+            self._deadline = now
+        remaining = self._deadline - now
+        if remaining < 0:
+            self.missed_deadlines += 1
+            self._deadline = now
+        else:
+            if remaining > SPIN_THRESHOLD:
+                if wake is None:
+                    time.sleep(remaining - SPIN_THRESHOLD)
+                else:
+                    # Tras un frame adelantado el plazo actual aún no ha empezado: hasta entonces no se adelanta
+                    opens = self._deadline - self.frame_budget - now
+                    if opens > 0:
+                        time.sleep(min(opens, remaining - SPIN_THRESHOLD))
+                    remaining = self._deadline - time.perf_counter()
+                    if remaining > SPIN_THRESHOLD and wake.wait(remaining - SPIN_THRESHOLD):
+                        self._deadline += self.frame_budget
+                        return
+            while time.perf_counter() < self._deadline:
+                pass
+        self._deadline += self.frame_budget
+
+    def steps(self):
+        # Número de pasos de simulación que tocan en este frame
+        now = time.perf_counter()
+        if self._last_tick is None:
+            self._last_tick = now
+            return 0
+        elapsed = now - self._last_tick
+        self._last_tick = now
+        self.frame_times.append(elapsed)
+        self.frames += 1
+        self.accumulator += elapsed
+        steps = int(self.accumulator / self.sim_dt)
+        if steps > self.max_steps:
+            # Demasiado retraso (parón, depurador...): se simula lo que da el tope y se descarta el resto
+            self.dropped_time += self.accumulator - self.max_steps * self.sim_dt
+            self.accumulator = 0.0
+            return self.max_steps
+        self.accumulator -= steps * self.sim_dt
+        return steps
+
+    def stats(self):
+        if not self.frame_times:
+            return None
+        times = np.array(self.frame_times) * 1000
+        p50, p95, p99 = np.percentile(times, [50, 95, 99])
+        return {
+            'fps': 1000 / times.mean(),
+            'p50_ms': p50,
+            'p95_ms': p95,
+            'p99_ms': p99,
+            'missed_deadlines': self.missed_deadlines,
+            'dropped_s': self.dropped_time,
+        }
+
+    def report(self):
+        stats = self.stats()
+        if stats is None:
+            return "Sin frames todavía"
+        return (f"FPS: {stats['fps']:.1f} | frame p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, "
+                f"p99 {stats['p99_ms']:.1f} ms | plazos perdidos: {stats['missed_deadlines']} | "
+                f"tiempo descartado: {stats['dropped_s']:.2f} s")
+
+class QualityGovernor:
+    # Vigila la carga de cada frame (tiempo de trabajo / presupuesto, en media exponencial) y baja o sube
+    # de nivel de QUALITY_LEVELS. Baja tras QUALITY_DEGRADE_FRAMES frames seguidos por encima de
+    # QUALITY_DEGRADE_LOAD y sube tras QUALITY_RESTORE_FRAMES por debajo de QUALITY_RESTORE_LOAD
+    def __init__(self, frame_budget=1 / FPS, levels=QUALITY_LEVELS):
+        self.frame_budget = frame_budget
+        self.levels = levels
+        self.index = 0
+        self.load = None
+        self.changes = 0
+        self._over = 0
+        self._under = 0
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    def observe(self, busy):
+        # busy: segundos de trabajo del frame (sin la espera del planificador). True si cambia de nivel
+        load = busy / self.frame_budget
+        self.load = load if self.load is None else self.load + QUALITY_SMOOTHING * (load - self.load)
+        if self.load > QUALITY_DEGRADE_LOAD:
+            self._over, self._under = self._over + 1, 0
+        elif self.load < QUALITY_RESTORE_LOAD:
+            self._over, self._under = 0, self._under + 1
+        else:
+            self._over = self._under = 0
+        if self._over >= QUALITY_DEGRADE_FRAMES and self.index < len(self.levels) - 1:
+            return self._set_index(self.index + 1)
+        if self._under >= QUALITY_RESTORE_FRAMES and self.index > 0:
+            return self._set_index(self.index - 1)
+        return False
+
+    def force(self, index):
+        # Al reproducir una sesión el nivel sale de la grabación, no de la carga medida
+        if index != self.index:
+            self.index = index
+            self.changes += 1
+            self._over = self._under = 0
+            print(f"Calidad: nivel {index} ({self.level['name']})")
+
+    def _set_index(self, index):
+        self.index = index
+        self.changes += 1
+        self._over = self._under = 0
+        print(f"Calidad: nivel {index} ({self.level['name']}), carga {self.load:.0%}")
+        return True
+
+class FrameProfiler:
+    # Tiempos por fase de cada frame en un anillo, con contadores (sprites, texturas, colas de carga).
+    # Uso: t = profiler.start(); ...; profiler.stop('fase', t). Desactivado, start() devuelve None y
+    # stop() sale en la primera línea, así que el coste es una llamada por fase
+    def __init__(self, history=PROFILER_HISTORY):
+        self.enabled = False
+        self.frames = deque(maxlen=history)  # (inicio, fin, ((fase, inicio, duración), ...), contadores)
+        self._frame_start = None
+        self._phases = []
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self._frame_start = None
+        self._phases = []
+        return self.enabled
+
+    def start(self):
+        if not self.enabled:
+            return None
+        now = time.perf_counter()
+        if self._frame_start is None:
+            self._frame_start = now
+        return now
+
+    def stop(self, name, start):
+        if start is None:
+            return
+        self._phases.append((name, start, time.perf_counter() - start))
+
+    def end_frame(self, **counters):
+        if not self.enabled or self._frame_start is None:
+            return
+        self.frames.append((self._frame_start, time.perf_counter(), tuple(self._phases), counters))
+        self._frame_start = None
+        self._phases = []
+
+    def summary(self, last=PROFILER_HUD_FRAMES):
+        # (ms medios por frame de cada fase, ms medios de frame, contadores del último frame)
+        frames = list(self.frames)[-last:]
+        if not frames:
+            return {}, 0.0, {}
+        totals = defaultdict(float)
+        for _, _, phases, _ in frames:
+            for name, _, duration in phases:
+                totals[name] += duration
+        phase_ms = {name: total * 1000 / len(frames) for name, total in totals.items()}
+        if len(frames) > 1:
+            frame_ms = (frames[-1][0] - frames[0][0]) * 1000 / (len(frames) - 1)
+        else:
+            frame_ms = (frames[0][1] - frames[0][0]) * 1000
+        return phase_ms, frame_ms, frames[-1][3]
+
+    def hud_lines(self):
+        phase_ms, frame_ms, counters = self.summary()
+        lines = [f"frame {frame_ms:.2f} ms ({1000 / frame_ms if frame_ms else 0:.0f} FPS)"]
+        lines += [f"{name:<20}{ms:7.2f} ms" for name, ms in phase_ms.items()]
+        lines += [f"{name:<20}{value:7}" for name, value in counters.items()]
+        return lines
+
+    def draw_hud(self, x=10, y=20, line_height=15):
+        # Texto con bitmaps de GLUT, con sombra para que se lea sobre cualquier fondo
+        for i, line in enumerate(self.hud_lines()):
+            for color, offset in (((0, 0, 0, 1), 1), ((1, 1, 0.2, 1), 0)):
+                glColor4f(*color)
+                glRasterPos2f(x + offset, y + i * line_height + offset)
+                for char in line.encode():
+                    glutBitmapCharacter(GLUT_BITMAP_8_BY_13, char)
+        glColor4f(1, 1, 1, 1)
+
+    def export_trace(self, path=PROFILER_TRACE_PATH):
+        # Eventos "X" (duración) por fase y "C" (contador) por frame, en microsegundos
+        events = []
+        if self.frames:
+            origin = self.frames[0][0]
+            for frame_start, frame_end, phases, counters in self.frames:
+                events.append({'name': 'frame', 'ph': 'X', 'pid': 1, 'tid': 0,
+                               'ts': (frame_start - origin) * 1e6, 'dur': (frame_end - frame_start) * 1e6})
+                for name, start, duration in phases:
+                    events.append({'name': name, 'ph': 'X', 'pid': 1, 'tid': 1,
+                                   'ts': (start - origin) * 1e6, 'dur': duration * 1e6})
+                if counters:
+                    events.append({'name': 'contadores', 'ph': 'C', 'pid': 1,
+                                   'ts': (frame_start - origin) * 1e6, 'args': counters})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(self.frames)
+
+def parse_osc(data):
+    # Mensajes OSC 1.0 (también dentro de bundles) como lista de (dirección, argumentos).
+    # Tipos: i, f, s, T, F. Lanza ValueError si el paquete está mal formado
+    if data.startswith(b'#bundle\0'):
+        messages = []
+        pos = 16  # '#bundle' + timetag (se ignora: todo se ejecuta en el siguiente frame)
+        while pos + 4 <= len(data):
+            size, = struct.unpack_from('>i', data, pos)
+            pos += 4
+            messages.extend(parse_osc(data[pos:pos + size]))
+            pos += size
+        return messages
+    address, pos = _osc_string(data, 0)
+    args = []
+    if pos < len(data):
+        tags, pos = _osc_string(data, pos)
+        if not tags.startswith(','):
+            raise ValueError(f"Etiquetas de tipo OSC no válidas: {tags!r}")
+        for tag in tags[1:]:
+            if tag == 'i':
+                args.append(struct.unpack_from('>i', data, pos)[0])
+                pos += 4
+            elif tag == 'f':
+                args.append(struct.unpack_from('>f', data, pos)[0])
+                pos += 4
+            elif tag == 's':
+                value, pos = _osc_string(data, pos)
+                args.append(value)
+            elif tag in 'TF':
+                args.append(tag == 'T')
+            else:
+                raise ValueError(f"Tipo OSC no soportado: {tag!r}")
+    return [(address, args)]
+
+def _osc_string(data, pos):
+    # Cadena terminada en \0 y rellenada hasta múltiplo de 4; devuelve también la posición siguiente
+    end = data.index(b'\0', pos)
+    return data[pos:end].decode('utf-8'), (end + 4) & ~3
+
+def encode_osc(address, *args):
+    def padded(text):
+        raw = text.encode('utf-8') + b'\0'
+        return raw + b'\0' * (-len(raw) % 4)
+    tags = ','
+    payload = b''
+    for arg in args:
+        if isinstance(arg, float):
+            tags += 'f'
+            payload += struct.pack('>f', arg)
+        elif isinstance(arg, int):
+            tags += 'i'
+            payload += struct.pack('>i', arg)
+        else:
+            tags += 's'
+            payload += padded(str(arg))
+    return padded(address) + padded(tags) + payload
+
+def parse_command_packet(data):
+    # OSC si empieza por '/' o '#bundle'; si no, texto: una orden por línea, palabras separadas por espacios
+    if data[:1] == b'/' or data.startswith(b'#bundle'):
+        return parse_osc(data), True
+    commands = []
+    for line in data.decode('utf-8').splitlines():
+        words = line.split()
+        if words:
+            commands.append(('/' + words[0], words[1:]))
+    return commands, False
+
+def command_key(address, args, keys=None):
+    # Traduce una orden a la tecla y modificadores que haría lo mismo con el teclado; None si no se conoce.
+    # /spawn z [1] (1 = rotando, como Ctrl), /remove z (como Shift), /background next|previous.
+    # El argumento puede ir también en la dirección: /spawn/z, /background/next.
+    # Solo se aceptan las teclas de GIFs (keys, por defecto Gif_mapping): nunca ESC ni otras teclas
+    keys = Gif_mapping if keys is None else keys
+    words = [part for part in address.split('/') if part] + [str(arg) for arg in args]
+    if len(words) < 2:
+        return None
+    action, target = words[0], words[1]
+    if action in ('spawn', 'remove') and target.encode('utf-8') not in keys:
+        return None
+    if action == 'spawn':
+        rotate = len(words) > 2 and words[2] not in ('0', 'False', 'false')
+        return target.encode('utf-8'), GLUT_ACTIVE_CTRL if rotate else 0
+    if action == 'remove':
+        return target.encode('utf-8'), GLUT_ACTIVE_SHIFT
+    if action == 'background':
+        key = {'next': b'\x27', 'previous': b'\x25'}.get(target)
+        return (key, 0) if key else None
+    return None
+
+class CommandProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.receive(data, addr)
+
+class CommandServer:
+    # Servidor UDP (texto u OSC) en un hilo con su propio bucle asyncio. Los datagramas se traducen a
+    # (tecla, modificadores) y se dejan en una deque: append y popleft son atómicos, así que el hilo de red
+    # y el de GLUT no comparten ningún lock. OpenGLApp.idle vacía la cola una vez por frame y, tras el swap
+    # de ese frame, se mide la latencia desde que llegó el datagrama (y se contesta a los /ping).
+    # wake despierta al FrameScheduler para que la orden no espere al siguiente plazo
+    def __init__(self, host=CONTROL_HOST, port=CONTROL_PORT, stats_window=CONTROL_STATS_WINDOW, keys=None):
+        # keys: teclas de GIFs que se pueden lanzar o quitar (por defecto las de Gif_mapping)
+        self.host = host
+        self.port = port
+        self.keys = Gif_mapping if keys is None else keys
+        self.commands = deque()
+        self.latencies = deque(maxlen=stats_window)
+        self.received = 0
+        self.rejected = 0
+        self._loop = None
+        self._transport = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.wake = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='control', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self._transport is not None
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            self._transport, _ = loop.run_until_complete(loop.create_datagram_endpoint(
+                lambda: CommandProtocol(self), local_addr=(self.host, self.port)))
+        except OSError as e:
+            print(f"No se pudo abrir el puerto de control {self.host}:{self.port}: {e}")
+            loop.close()
+            self._ready.set()
+            return
+        self.port = self._transport.get_extra_info('sockname')[1]
+        self._loop = loop
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            self._transport.close()
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.close()
+
+    def receive(self, data, addr):
+        # Hilo de red: solo traduce y encola, sin tocar el estado del GIFManager
+        received = time.perf_counter()
+        try:
+            commands, osc = parse_command_packet(data)
+        except (ValueError, UnicodeDecodeError, struct.error) as e:
+            self.rejected += 1
+            print(f"Paquete de control no válido de {addr[0]}: {e}")
+            return
+        for address, args in commands:
+            if address == '/ping':
+                self.commands.append((None, 0, received, addr, osc))
+                continue
+            command = command_key(address, args, self.keys)
+            if command is None:
+                self.rejected += 1
+                print(f"Orden de control desconocida de {addr[0]}: {address} {args}")
+                # Estamos en el hilo del bucle asyncio: se contesta directamente
+                if self._transport is not None:
+                    reply = encode_osc('/error', address) if osc else f"error {address}".encode('utf-8')
+                    self._transport.sendto(reply, addr)
+                continue
+            self.received += 1
+            self.commands.append((command[0], command[1], received, addr, osc))
+        if self.commands:
+            self.wake.set()
+
+    def drain(self):
+        # Hilo de GLUT, una vez por frame: las órdenes que han llegado hasta ahora, en orden de llegada
+        self.wake.clear()
+        commands = []
+        while self.commands:
+            commands.append(self.commands.popleft())
+        return commands
+
+    def frame_presented(self, applied):
+        # Tras el swap del frame que aplicó las órdenes: latencia entrada -> pantalla y respuesta a los /ping
+        now = time.perf_counter()
+        for key, _, received, addr, osc in applied:
+            latency = now - received
+            self.latencies.append(latency)
+            if key is None and self._loop is not None:
+                reply = encode_osc('/pong', latency * 1000) if osc else f"pong {latency * 1000:.3f}".encode('utf-8')
+                self._loop.call_soon_threadsafe(self._transport.sendto, reply, addr)
+
+    def report(self, frame_budget):
+        if not self.latencies:
+            return f"Control UDP en el puerto {self.port}: sin órdenes"
+        ms = np.array(self.latencies) * 1000
+        p50, p95 = np.percentile(ms, [50, 95])
+        return (f"Control: {self.received} órdenes, {self.rejected} rechazadas | latencia p50 {p50:.1f} ms, "
+                f"p95 {p95:.1f} ms, máx {ms.max():.1f} ms (frame {frame_budget * 1000:.1f} ms)")
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=1)
+            self._loop = None
+
+class SessionRecorder:
+    # Graba las órdenes de una sesión (teclas, también las de red, y cambios de calidad) con el paso de
+    # simulación en que se aplican. Formato: cabecera '<4sHQ' (magia, versión, semilla) y registros de 7 bytes
+    # '<IBBB' (paso, tipo, tecla o nivel, modificadores); el último es el fin de la sesión
+    MAGIC = b'SREC'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHQ')
+    RECORD = struct.Struct('<IBBB')
+    KEY, QUALITY, END = 0, 1, 2
+
+    def __init__(self, path, seed):
+        self.path = path
+        self.events = 0
+        self._file = open(path, 'wb')
+        self._file.write(self.HEADER.pack(self.MAGIC, self.VERSION, seed))
+
+    def key(self, tick, key, mods):
+        if len(key) == 1:  # Las de red que no son una tecla no hacen nada: no se graban
+            self._write(tick, self.KEY, key[0], mods)
+
+    def quality(self, tick, index):
+        self._write(tick, self.QUALITY, index, 0)
+
+    def _write(self, tick, kind, value, mods):
+        self._file.write(self.RECORD.pack(tick, kind, value, mods))
+        self.events += 1
+
+    def close(self, tick):
+        if self._file is None:
+            return
+        self._write(tick, self.END, 0, 0)
+        self._file.close()
+        self._file = None
+
+class SessionReplay:
+    # Lee una sesión de SessionRecorder y entrega sus eventos (tipo, valor, modificadores) paso a paso
+    def __init__(self, path, unthrottled=False):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.seed = SessionRecorder.HEADER.unpack_from(data)
+        if magic != SessionRecorder.MAGIC or version != SessionRecorder.VERSION:
+            raise ValueError(f"{path} no es una sesión grabada compatible")
+        self.events = list(SessionRecorder.RECORD.iter_unpack(data[SessionRecorder.HEADER.size:]))
+        self.unthrottled = unthrottled
+        self.end_tick = self.events[-1][0] if self.events else 0
+        self._next = 0
+
+    def due(self, tick):
+        # Eventos de los pasos <= tick aún no entregados, en orden de grabación
+        start = self._next
+        while self._next < len(self.events) and self.events[self._next][0] <= tick:
+            self._next += 1
+        return [event[1:] for event in self.events[start:self._next]]
+
+    @property
+    def finished(self):
+        return self._next >= len(self.events)
 
 class OpenGLApp:
-    def __init__(self):
+    def __init__(self, seed=None, record=None, replay=None, unthrottled=False, gpu_motion=GPU_MOTION):
+        # record: fichero donde grabar la sesión; replay: sesión grabada a reproducir (con su semilla y
+        # cargas síncronas), a ritmo normal o, con unthrottled, tan rápido como se pueda.
+        # gpu_motion: los GIFs que no se pegan se mueven en la GPU (GPUSpriteLayer)
+        self.replay = SessionReplay(replay, unthrottled) if replay else None
+        if self.replay is not None:
+            seed = self.replay.seed
+        elif seed is None:
+            seed = random.randrange(2 ** 32)
         self.fullscreen = False
+        self.running = True
         self.screen_width = 800
         self.screen_height = 600
         self.backgrounds = Backgrounds
         self.gif_mapping = Gif_mapping
-        self.bg_manager = BackgroundManager(self.backgrounds)
-        self.gif_manager = GIFManager()
+        self.asset_pack = load_asset_pack(gif_mapping=self.gif_mapping)
+        self.profiler = FrameProfiler()
+        self.scheduler = FrameScheduler()
+        self.quality = QualityGovernor(self.scheduler.frame_budget)
+        self._work_start = None
+        self.gif_manager = GIFManager(asset_pack=self.asset_pack, profiler=self.profiler, quality=self.quality, seed=seed,
+                                      gpu_motion=gpu_motion)
+        self.gif_manager.synchronous_loads = self.replay is not None
+        self.recorder = SessionRecorder(record, seed) if record else None
+        print(f"Semilla: {seed}")
+        # Los fondos comparten el presupuesto de subida de texturas con los sprites
+        self.bg_manager = BackgroundManager(self.backgrounds, asset_pack=self.asset_pack, uploader=self.gif_manager.uploader)
+        self.batch = SpriteBatch()
+        # Al reproducir no se aceptan órdenes de red: la sesión tiene que ser la grabada
+        self.control = CommandServer(keys=self.gif_mapping) if CONTROL_ENABLED and self.replay is None else None
+        self.capture = None  # FrameCapture mientras se graba (F5)
+        self._applied_commands = []
+        self._last_stats_report = time.monotonic()
+        self._last_frame_report = time.monotonic()
         # self.current_bg_index eliminado, el fondo se gestiona en BackgroundManager
 
     def display(self):
+        profiler = self.profiler
+        t = profiler.start()
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glLoadIdentity()
-        self.bg_manager.draw(self.screen_width, self.screen_height)
-        self.gif_manager.draw()
+        self.bg_manager.draw(self.screen_width, self.screen_height, self.batch)
+        profiler.stop('fondo', t)
+        t = profiler.start()
+        self.gif_manager.draw(self.batch)
+        profiler.stop('dibujo', t)
+        if profiler.enabled:
+            profiler.draw_hud()
+        if self._work_start is not None:
+            # Carga del frame para el QualityGovernor: desde que acaba la espera hasta antes del swap
+            # (con vsync el swap bloquea y no es trabajo). Al reproducir, los niveles vienen de la grabación
+            if self.replay is None and self.quality.observe(time.perf_counter() - self._work_start):
+                self.gif_manager.prefetch(self.gif_mapping)
+                if self.recorder:
+                    self.recorder.quality(self.gif_manager.ticks, self.quality.index)
+            self._work_start = None
+        if self.capture is not None:
+            t = profiler.start()
+            self.capture.capture()
+            profiler.stop('captura', t)
+            if self.capture.failed():
+                print(f"Grabación detenida: {self.capture.error}")
+                self.stop_capture()
+        t = profiler.start()
         glutSwapBuffers()
+        profiler.stop('swap', t)
+        if self._applied_commands:
+            self.control.frame_presented(self._applied_commands)
+            self._applied_commands = []
+        if profiler.enabled:
+            cache = self.gif_manager.texture_cache
+            profiler.end_frame(sprites=len(self.gif_manager.all_gifs()), explosiones=len(self.gif_manager.explosions),
+                               texturas=texture_stats.count, cola_decodificacion=cache.decode_pool.pending(),
+                               cola_subida=len(self.gif_manager.uploader.queue), calidad=self.quality.index)
 
     def idle(self):
+        profiler = self.profiler
+        t = profiler.start()
+        if self.replay is None or not self.replay.unthrottled:
+            self.scheduler.wait_for_frame(self.control.wake if self.control is not None else None)
+        profiler.stop('espera', t)
+        self._work_start = time.perf_counter()
+        if self.control is not None:
+            # Órdenes de red llegadas durante la espera: se aplican en este frame, igual que una tecla
+            for command in self.control.drain():
+                if command[0] is not None:
+                    self.handle_key(command[0], command[1])
+                self._applied_commands.append(command)
+        t = profiler.start()
+        self.bg_manager.update()
         self.gif_manager.process_pending()
-        self.gif_manager.update()
+        profiler.stop('process_pending', t)
+        steps = self.scheduler.steps()
+        if self.replay is not None:
+            if not self.replay_steps():
+                return
+        else:
+            for _ in range(steps):
+                self.gif_manager.update(self.scheduler.sim_dt)
+        now = time.monotonic()
+        if now - self._last_stats_report >= TEXTURE_STATS_INTERVAL:
+            self._last_stats_report = now
+            print(texture_stats.report())
+        if now - self._last_frame_report >= FRAME_STATS_INTERVAL:
+            self._last_frame_report = now
+            print(self.scheduler.report())
+            if self.control is not None and self.control.latencies:
+                print(self.control.report(self.scheduler.frame_budget))
+            if self.capture is not None:
+                print(self.capture.report())
         glutPostRedisplay()
-        time.sleep(1/FPS)
+
+    def replay_steps(self):
+        # Pasos fijos por frame (no según el reloj) aplicando los eventos grabados justo antes del paso en
+        # que se aplicaron. False si la sesión ha terminado y se ha cerrado
+        manager = self.gif_manager
+        for _ in range(SESSION_STEPS_PER_FRAME):
+            for kind, value, mods in self.replay.due(manager.ticks):
+                if kind == SessionRecorder.KEY:
+                    self.handle_key(bytes([value]), mods)
+                    if not self.running:  # ESC grabado
+                        return False
+                elif kind == SessionRecorder.QUALITY:
+                    self.quality.force(value)
+                else:
+                    print(f"Fin de la sesión grabada en el paso {manager.ticks}")
+                    self.quit()
+                    return False
+            manager.process_pending()
+            manager.update(self.scheduler.sim_dt)
+        return True
+
+    def quit(self):
+        self.running = False
+        self.shutdown()
+        try:
+            glutLeaveMainLoop()
+        except Exception:
+            sys.exit()
+
+    def shutdown(self):
+        if self.recorder is not None:
+            self.recorder.close(self.gif_manager.ticks)
+            print(f"Sesión grabada en {self.recorder.path}: {self.recorder.events} eventos")
+        if self.control is not None:
+            self.control.stop()
+        self.stop_capture()
+        self.gif_manager.release_all()
+        self.bg_manager.release()
+        self.batch.release()
+        if self.asset_pack is not None:
+            self.asset_pack.close()
+        print(texture_stats.report())
+        print(self.scheduler.report())
 
     def keyboard(self, key, x, y):
-        mods = glutGetModifiers()
+        self.handle_key(key, glutGetModifiers())
+
+    def handle_key(self, key, mods):
+        # Acción de una tecla con sus modificadores; la usan el teclado, el servidor de control y la
+        # reproducción de sesiones
         # print(f"Tecla: {key}, mods: {mods}")
+        if self.recorder is not None:
+            self.recorder.key(self.gif_manager.ticks, key, mods)
         # Shift + tecla: eliminar todos los GIFs de esa tecla
         if (mods & GLUT_ACTIVE_SHIFT):
             key_lower = key.lower()
@@ -380,10 +3340,7 @@ class OpenGLApp:
         # Otras teclas
         match key:
             case b'\x1b': # ESC para salir
-                try:
-                    glutLeaveMainLoop()
-                except Exception:
-                    sys.exit()
+                self.quit()
             case b'\x27': # Flecha derecha
                 self.bg_manager.next()
             case b'\x25': # Flecha izquierda
@@ -391,7 +3348,38 @@ class OpenGLApp:
             case _:
                 pass
 
+    def special(self, key, x, y):
+        # F3: activar/desactivar el profiler y su HUD. F4: exportar lo grabado a Chrome trace
+        if key == GLUT_KEY_F3:
+            print(f"Profiler {'activado' if self.profiler.toggle() else 'desactivado'}")
+        elif key == GLUT_KEY_F4:
+            frames = self.profiler.export_trace()
+            print(f"Traza de {frames} frames exportada a {PROFILER_TRACE_PATH}")
+        elif key == GLUT_KEY_F5:
+            # F5: empezar/terminar la grabación
+            if self.capture is None:
+                self.start_capture()
+            else:
+                self.stop_capture()
+
+    def start_capture(self):
+        self.capture = FrameCapture(glutGet(GLUT_WINDOW_WIDTH), glutGet(GLUT_WINDOW_HEIGHT))
+        self.capture.start()
+        print(f"Grabando {self.capture.width}x{self.capture.height} en {self.capture.output}")
+
+    def stop_capture(self):
+        if self.capture is None:
+            return
+        self.capture.stop()
+        print(self.capture.report())
+        self.capture = None
+
     def reshape(self, width, height):
+        self.bg_manager.set_screen_size(width, height)
+        if self.capture is not None and (width, height) != (self.capture.source_width, self.capture.source_height):
+            # El tamaño grabado es fijo: se cierra la grabación y se empieza otra con el tamaño nuevo
+            self.stop_capture()
+            self.start_capture()
         glViewport(0, 0, width, height)
         glMatrixMode(GL_PROJECTION)
         glLoadIdentity()
@@ -409,67 +3397,95 @@ class OpenGLApp:
         glutCreateWindow(b'Sanches Sesion')
         if self.fullscreen:
             glutFullScreen()
+        if self.scheduler.vsync and not enable_vsync():
+            print("No se pudo activar vsync: se usa el temporizador")
+            self.scheduler.vsync = False
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self.gif_manager.texture_cache.decode_pool.warm_up()
+        self.gif_manager.preload_effects()
+        self.gif_manager.prefetch(self.gif_mapping)
+        self.bg_manager.set_screen_size(self.screen_width, self.screen_height)
         self.bg_manager.load_textures()
+        # Lo cargado al arrancar no cambia: fuera de las pasadas del recolector, que así son más cortas
+        gc.collect()
+        gc.freeze()
         glutDisplayFunc(self.display)
         glutIdleFunc(self.idle)
         glutKeyboardFunc(self.keyboard)
+        glutSpecialFunc(self.special)
         glutReshapeFunc(self.reshape)
+        if self.control is not None and self.control.start():
+            print(f"Control UDP/OSC escuchando en {self.control.host}:{self.control.port}")
         glutMainLoop()
 
 
 class ExplosionEffect:
-    def __init__(self, x, y, duration_frames=30, image_path='./img/blood.png', cabeza_gif=None):
-        self.x = x
-        self.y = y
-        self.duration = duration_frames
-        self.frame = 0
-        self.active = True
-        self.texture_id = None
-        self.width = 64
-        self.height = 64
-        self.cabeza_gif = cabeza_gif  # Referencia al GIF de tipo cabeza
-        try:
-            img = Image.open(image_path).convert('RGBA')
-            self.width, self.height = img.size
-            img_data = img.tobytes()
-            self.texture_id = glGenTextures(1)
-            glBindTexture(GL_TEXTURE_2D, self.texture_id)
-            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.width, self.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
-        except Exception as e:
-            print(f"Error cargando imagen de explosión: {e}")
-            self.active = False
+    # Registro compacto reutilizable: la textura (entry) es la que el GIFManager precarga al arrancar y
+    # reset() lo coloca sobre una cabeza nueva sin tocar disco ni la caché
+    __slots__ = ('entry', 'x', 'y', 'duration', 'elapsed', 'active', 'texture_id', 'uv', 'crop', 'width', 'height',
+                 'cabeza_gif')
 
-    def update(self):
-        self.frame += 1
-        if self.cabeza_gif is not None:
-            # Seguir la cabeza
-            self.x = int(self.cabeza_gif.x + self.cabeza_gif.width // 2 - self.width // 2)
-            self.y = int(self.cabeza_gif.y + self.cabeza_gif.height // 2 - self.height // 2)
-        if self.frame >= self.duration:
-            self.active = False
+    def __init__(self, entry, duration=EXPLOSION_DURATION):
+        self.entry = entry
+        self.duration = duration  # Segundos
+        self.cabeza_gif = None
+        self.reset(None)
 
-    def draw(self):
-        if not self.active or self.texture_id is None:
-            return
-        glEnable(GL_TEXTURE_2D)
-        glBindTexture(GL_TEXTURE_2D, self.texture_id)
-        glColor4f(1, 1, 1, 1)
-        glBegin(GL_QUADS)
-        glTexCoord2f(0, 0); glVertex2f(self.x, self.y)
-        glTexCoord2f(1, 0); glVertex2f(self.x + self.width, self.y)
-        glTexCoord2f(1, 1); glVertex2f(self.x + self.width, self.y + self.height)
-        glTexCoord2f(0, 1); glVertex2f(self.x, self.y + self.height)
-        glEnd()
-        glDisable(GL_TEXTURE_2D)
+    def reset(self, cabeza_gif, x=0, y=0):
+        self.elapsed = 0.0
+        self.cabeza_gif = cabeza_gif  # Referencia al GIF de tipo cabeza
+        self.active = bool(self.entry.frames)
+        if self.active:
+            self.texture_id = self.entry.frames[0]
+            self.uv = self.entry.uvs[0]
+            self.crop = self.entry.crops[0]
+            self.width, self.height = self.entry.sizes[0]
+        else:
+            self.texture_id = None
+            self.uv = SpriteBatch.FULL_UV
+            self.width = self.height = 64
+            self.crop = (0, 0, 64, 64)
+        self.x, self.y = x, y
+        if cabeza_gif is not None:
+            self._follow()
 
+    def release(self):
+        # La textura es del GIFManager: solo se desactiva para volver al pool
+        self.cabeza_gif = None
+        self.texture_id = None
+        self.active = False
 
+    def _follow(self):
+        self.x = int(self.cabeza_gif.x + self.cabeza_gif.width // 2 - self.width // 2)
+        self.y = int(self.cabeza_gif.y + self.cabeza_gif.height // 2 - self.height // 2)
 
+    def update(self, dt):
+        self.elapsed += dt
+        if len(self.entry.frames) > 1:
+            # Efecto animado: frame según el tiempo transcurrido
+            index = self.entry.frame_at(self.elapsed)
+            self.texture_id = self.entry.frames[index]
+            self.uv = self.entry.uvs[index]
+            self.crop = self.entry.crops[index]
+            self.width, self.height = self.entry.sizes[index]
+        if self.cabeza_gif is not None:
+            # Seguir la cabeza
+            self._follow()
+        if self.elapsed >= self.duration:
+            self.active = False
 
 
 if __name__ == '__main__':
-    app = OpenGLApp()
+    import argparse
+    parser = argparse.ArgumentParser(description="Background de Los Sanches Tekno Session")
+    parser.add_argument('--seed', type=int, help="Semilla de posiciones y velocidades de los GIFs")
+    parser.add_argument('--record', metavar='FICHERO', help="Grabar las teclas de la sesión para reproducirla")
+    parser.add_argument('--replay', metavar='FICHERO', help="Reproducir una sesión grabada con --record")
+    parser.add_argument('--unthrottled', action='store_true', help="Reproducir sin esperar al siguiente frame")
+    parser.add_argument('--gpu-motion', action='store_true', default=GPU_MOTION,
+                        help="Mover en la GPU los GIFs que no se pegan (debajo de los demás)")
+    args, _ = parser.parse_known_args()
+    app = OpenGLApp(seed=args.seed, record=args.record, replay=args.replay, unthrottled=args.unthrottled,
+                    gpu_motion=args.gpu_motion)
     app.run()